@@ -2,148 +2,118 @@ import json
 import numpy as np
 from rich.console import Console
 
+from bar_store import BarStore
+from fundamentals import FundamentalsCache
+import metrics
+from risk import RiskEngine
+import snapshot
+from ui import pause
+
 console = Console()
 
 _storage = None
 _price_fetcher = None
+_bar_store = None
+_fundamentals = None
+_risk = None
 
-def init(storage, price_fetcher):
-    global _storage, _price_fetcher
+def init(storage, price_fetcher, bar_store=None, fundamentals=None, risk_engine=None):
+    global _storage, _price_fetcher, _bar_store, _fundamentals, _risk
     _storage = storage
     _price_fetcher = price_fetcher
+    _bar_store = bar_store or BarStore(price_fetcher.provider)
+    _fundamentals = fundamentals or FundamentalsCache(price_fetcher.provider)
+    _risk = risk_engine or RiskEngine(_bar_store)
 
-def get_price(ticker):
-    if _price_fetcher is None:
-        return None
-    return _price_fetcher.get_price(ticker)
+def get_snapshot(username, fetch=True):
+    return snapshot.get_snapshot(_storage, _price_fetcher, username, fetch)
 
+@metrics.timed()
 def portfolio_value(username):
-    total = 0.0
-    portfolios = _storage.load_portfolios()
-    if username not in portfolios:
+    snap = get_snapshot(username)
+    if snap is None:
         return 0.0
-    holdings = portfolios[username].get("holdings", {})
-    for ticker, lots in holdings.items():
-        total_qty = sum(int(lot.get('qty', 0)) for lot in lots)
-        price = get_price(ticker)
-        if price is None or total_qty == 0:
-            continue
-        total += price * total_qty
-    return round(total, 2)
+    return round(snap.total_value, 2)
 
+@metrics.timed()
 def portfolio_pnl(username):
-    portfolios = _storage.load_portfolios()
-    if username not in portfolios:
-        return 0.0
-    holdings = portfolios[username].get("holdings", {})
-    if not holdings:
+    snap = get_snapshot(username)
+    if snap is None:
         return 0.0
+    return round(snap.total_pnl, 2)
 
-    total_pnl = 0.0
-    for ticker, lots in holdings.items():
-        total_qty = sum(int(lot.get('qty', 0)) for lot in lots)
-        if total_qty == 0:
-            continue
-        avg_buy_price = sum(int(lot['qty']) * float(lot['price']) for lot in lots) / total_qty
-        current_price = get_price(ticker)
-        if current_price is None:
-            continue
-        total_pnl += (current_price - avg_buy_price) * total_qty
-    return round(total_pnl, 2)
-
+@metrics.timed()
 def portfolio_valuation(username):
     sp500_pe = 22
-    portfolios = _storage.load_portfolios()
-    if username not in portfolios:
+    snap = get_snapshot(username)
+    if snap is None:
         console.print("[bold red]User not found.[/bold red]")
-        input("Press Enter to return to main screen...")
+        pause("Press Enter to return to main screen...")
         return
 
-    holdings = portfolios[username].get("holdings", {})
-    total_value = 0.0
-    pe_sum = 0.0
-
-    for ticker, lots in holdings.items():
-        qty = sum(int(lot.get('qty', 0)) for lot in lots)
-        price = get_price(ticker)
-        if price is None or qty == 0:
-            continue
-        value = price * qty
-        total_value += value
-        try:
-            stock = __import__("yfinance").Ticker(ticker)
-            pe = stock.info.get('trailingPE')
-            if pe is not None and pe > 0:
-                pe_sum += pe * value
-        except Exception:
-            continue
+    pes = _fundamentals.get_many(snap.tickers, 'trailingPE')
+    pe_vec = np.array([pes.get(t) or 0.0 for t in snap.tickers], dtype=np.float64)
+    total_value = snap.total_value
+    pe_sum = float(np.dot(np.where(pe_vec > 0, pe_vec, 0.0), snap.values))
 
     avg_pe = round(pe_sum / total_value, 2) if total_value > 0 else 0
+    dcf_upside = round((sp500_pe / avg_pe - 1) * 100, 2) if avg_pe > 0 else None
     console.print(f"[bold white]Weighted Avg Portfolio P/E:[/bold white] [bold green]{avg_pe}[/bold green]")
     console.print(f"[bold white]S&P 500 P/E:[/bold white] [bold cyan]{sp500_pe}[/bold cyan]")
 
     if avg_pe > 0:
         pe_color = "green" if avg_pe < sp500_pe else "red"
         console.print(f"[bold white]Portfolio P/E is[/bold white] [{pe_color}]{'lower' if avg_pe < sp500_pe else 'higher'}[/{pe_color}] [bold white]than S&P 500.[/bold white]")
-        dcf_upside = round((sp500_pe / avg_pe - 1) * 100, 2)
         console.print(f"[bold white]Simple DCF Upside vs S&P 500:[/bold white] [bold green]{dcf_upside}%[/bold green]")
     else:
         console.print("[bold red]Insufficient data for DCF calculation.[/bold red]")
 
-    input("Press Enter to return to main screen...")
+    pause("Press Enter to return to main screen...")
+    return {"weighted_pe": avg_pe, "sp500_pe": sp500_pe, "dcf_upside": dcf_upside}
 
+@metrics.timed()
 def portfolio_risk_metrics(username):
-    portfolios = _storage.load_portfolios()
-    if username not in portfolios:
+    snap = get_snapshot(username)
+    if snap is None:
         console.print("[bold red]User not found.[/bold red]")
-        input("Press Enter to return to main screen...")
+        pause("Press Enter to return to main screen...")
         return
 
-    holdings = portfolios[username].get("holdings", {})
-    total_value = 0.0
-    sector_alloc = {}
-    betas = []
-    weights = []
-    returns = []
-
-    for ticker, lots in holdings.items():
-        qty = sum(int(lot.get('qty', 0)) for lot in lots)
-        price = get_price(ticker)
-        if price is None or qty == 0:
-            continue
-        value = price * qty
-        total_value += value
-
-        sector = lots[0].get('sector', 'Unknown') if lots else 'Unknown'
-        sector_alloc[sector] = sector_alloc.get(sector, 0) + value
-
-        # beta - keep previous behaviour: try to read from lot metadata else default 1
-        try:
-            beta = float(lots[0].get('beta', 1))
-        except Exception:
-            beta = 1.0
-        betas.append(beta)
-        weights.append(value)
-
-        try:
-            stock = __import__("yfinance").Ticker(ticker)
-            hist = stock.history(period='1y')
-            if not hist.empty and 'Close' in hist:
-                pct_returns = hist['Close'].pct_change().dropna()
-                returns.extend(pct_returns.tolist())
-        except Exception:
-            continue
-
-    weighted_beta = round(np.average(betas, weights=weights), 2) if betas and weights else 1.0
-    volatility = round(np.std(returns), 4) if returns else 0.0
+    total_value = snap.total_value
+    sector_alloc = snap.sector_values
+    with metrics.timer("risk.model"):
+        risk = _risk.metrics({t: float(v) for t, v in zip(snap.tickers, snap.values)})
+
+    beta = round(risk["beta"], 2)
+    volatility = round(risk["volatility"], 4)
+    annual_volatility = round(risk["annual_volatility"] * 100, 2)
     sector_percent = [v / total_value for v in sector_alloc.values()] if total_value > 0 else []
     hhi = sum([p**2 for p in sector_percent])
     diversification_score = round((1 - hhi) * 100, 2) if sector_percent else 0.0
-
-    console.print(f"[bold white]Portfolio Beta (weighted):[/bold white] [bold blue]{weighted_beta}[/bold blue]")
-    console.print(f"[bold white]Portfolio Volatility (1y std):[/bold white] [bold magenta]{volatility}[/bold magenta]")
+    sector_weights = {k: round(v / total_value * 100, 2) for k, v in sector_alloc.items() if total_value > 0}
+    missing = [t for t, p in zip(snap.tickers, snap.priced) if p and t not in risk["covered"]]
+
+    console.print(f"[bold white]Portfolio Beta (vs {_risk.benchmark}):[/bold white] [bold blue]{beta}[/bold blue]")
+    console.print(f"[bold white]Portfolio Volatility (daily / annualized):[/bold white] [bold magenta]{volatility} / {annual_volatility}%[/bold magenta]")
+    confidence = int(_risk.confidence * 100)
+    for label, var_key, cvar_key in (("Historical", "var_hist", "cvar_hist"), ("Parametric", "var_param", "cvar_param")):
+        var, cvar = risk[var_key], risk[cvar_key]
+        console.print(f"[bold white]1-Day {confidence}% VaR / CVaR ({label}):[/bold white] "
+                      f"[bold red]${var * total_value:,.2f} ({var * 100:.2f}%) / ${cvar * total_value:,.2f} ({cvar * 100:.2f}%)[/bold red]")
+    if missing:
+        console.print(f"[yellow]Not enough price history for: {', '.join(missing)}[/yellow]")
     console.print(f"[bold white]Diversification Score:[/bold white] [bold green]{diversification_score}[/bold green] [white](higher is better)[/white]")
-    console.print(f"[bold white]Sector Allocation (%):[/bold white] [bold cyan]{ {k: round(v / total_value * 100, 2) for k, v in sector_alloc.items() if total_value > 0} }[/bold cyan]")
-
-    input("Press Enter to return to main screen...")
-    return
\ No newline at end of file
+    console.print(f"[bold white]Sector Allocation (%):[/bold white] [bold cyan]{sector_weights}[/bold cyan]")
+
+    pause("Press Enter to return to main screen...")
+    return {
+        "beta": beta,
+        "benchmark": _risk.benchmark,
+        "volatility": volatility,
+        "annual_volatility": annual_volatility,
+        "confidence": _risk.confidence,
+        **{key: round(risk[key] * total_value, 2) for key in ("var_hist", "cvar_hist", "var_param", "cvar_param")},
+        "diversification_score": diversification_score,
+        "sector_allocation": sector_weights,
+        "missing_history": missing,
+    }
\ No newline at end of file
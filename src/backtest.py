@@ -0,0 +1,352 @@
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from positions import LotQueue
+from risk import TRADING_DAYS, align_closes
+from storage import STARTING_CASH
+import ui
+from ui import pause
+
+console = Console()
+
+_bar_store = None
+
+def init(bar_store):
+    global _bar_store
+    _bar_store = bar_store
+
+
+def load_closes(bar_store, tickers, period="5y"):
+    """
+    Reads daily closes for tickers from the BarStore as a days x tickers matrix
+    on the union of their dates (forward-filled, NaN before a ticker's first bar),
+    rounded to cents like interactive fills. Tickers with no data are dropped.
+    """
+    series = {}
+    for ticker in tickers:
+        dates, closes = bar_store.get_closes(ticker, period)
+        keep = ~np.isnan(closes)
+        if keep.any():
+            series[ticker] = (np.asarray(dates[keep]), np.asarray(closes[keep]))
+    dates, prices = align_closes(series)
+    return dates, list(series), np.round(prices, 2)
+
+
+class Book:
+    """
+    Simulated account with the same rules as utils.buy / utils.sell: whole
+    shares, a buy must fit in cash, a sell cannot exceed the shares held and
+    consumes the oldest lots first. Share counts are also kept in a vector
+    aligned with `tickers` so equity is one dot product per bar.
+    """
+    def __init__(self, tickers, cash=STARTING_CASH):
+        self.cash = float(cash)
+        self.index = {ticker: i for i, ticker in enumerate(tickers)}
+        self.shares = np.zeros(len(tickers), dtype=np.int64)
+        self.holdings = {}
+        self.trades = []
+        self.realized = 0.0
+
+    def qty(self, ticker):
+        return int(self.shares[self.index[ticker]])
+
+    def buy(self, day, ticker, qty, price):
+        qty = int(qty)
+        if qty <= 0 or not price > 0 or price * qty > self.cash:
+            return False
+        self.cash -= price * qty
+        self.shares[self.index[ticker]] += qty
+        self.holdings.setdefault(ticker, LotQueue()).append({"qty": qty, "price": float(price)})
+        self.trades.append({"date": str(day), "ticker": ticker, "side": "buy", "qty": qty, "price": float(price), "pnl": 0.0})
+        return True
+
+    def sell(self, day, ticker, qty, price):
+        qty = int(qty)
+        if qty <= 0 or not price > 0 or qty > self.qty(ticker):
+            return False
+        sold_lots = self.holdings[ticker].consume(qty)
+        pnl = sum((price - lot["buy_price"]) * lot["qty"] for lot in sold_lots)
+        self.cash += price * qty
+        self.shares[self.index[ticker]] -= qty
+        self.realized += pnl
+        if not self.holdings[ticker]:
+            del self.holdings[ticker]
+        self.trades.append({"date": str(day), "ticker": ticker, "side": "sell", "qty": qty, "price": float(price), "pnl": round(pnl, 2)})
+        return True
+
+
+class BarContext:
+    """
+    What an event-driven strategy sees on each bar: the current date and close,
+    history up to and including today (never beyond), and the book to trade on.
+    Orders fill at today's close.
+    """
+    def __init__(self, dates, tickers, closes, book):
+        self.dates = dates
+        self.tickers = tickers
+        self.book = book
+        self._closes = closes
+        self.t = 0
+
+    @property
+    def date(self):
+        return self.dates[self.t]
+
+    @property
+    def cash(self):
+        return self.book.cash
+
+    def price(self, ticker):
+        return float(self._closes[self.t, self.book.index[ticker]])
+
+    def history(self, ticker, lookback=None):
+        column = self._closes[:self.t + 1, self.book.index[ticker]]
+        return column if lookback is None else column[-lookback:]
+
+    def position(self, ticker):
+        return self.book.qty(ticker)
+
+    def equity(self):
+        return self.book.cash + float(self.book.shares @ np.nan_to_num(self._closes[self.t]))
+
+    def buy(self, ticker, qty):
+        return self.book.buy(self.date, ticker, qty, self.price(ticker))
+
+    def sell(self, ticker, qty):
+        return self.book.sell(self.date, ticker, qty, self.price(ticker))
+
+
+class BacktestResult:
+    """Equity curve (one value per bar), cash curve, trade list and summary stats."""
+    def __init__(self, dates, tickers, equity, cash, trades, realized, start_cash):
+        self.dates = dates
+        self.tickers = tickers
+        self.equity = equity
+        self.cash = cash
+        self.trades = trades
+        self.stats = summarize(dates, equity, trades, realized, start_cash)
+
+
+def summarize(dates, equity, trades, realized, start_cash):
+    if not len(equity):
+        return {"trades": 0}
+    returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.zeros(0)
+    years = max((dates[-1] - dates[0]).astype(int) / 365.25, 1 / 365.25)
+    std = float(np.std(returns, ddof=1)) if len(returns) > 1 else 0.0
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    final = float(equity[-1])
+    return {
+        "start": str(dates[0]),
+        "end": str(dates[-1]),
+        "final_equity": round(final, 2),
+        "total_return": final / start_cash - 1,
+        "cagr": float((final / start_cash) ** (1 / years) - 1) if final > 0 else -1.0,
+        "annual_volatility": std * float(np.sqrt(TRADING_DAYS)),
+        "sharpe": float(returns.mean() / std * np.sqrt(TRADING_DAYS)) if std > 0 else 0.0,
+        "max_drawdown": float(drawdown.min()),
+        "trades": len(trades),
+        "realized_pnl": round(realized, 2),
+    }
+
+
+def run_events(dates, tickers, closes, strategy, cash=STARTING_CASH):
+    """
+    Event-driven backtest for path-dependent logic: strategy(ctx) is called once
+    per bar with a BarContext and places orders through ctx.buy / ctx.sell.
+    """
+    book = Book(tickers, cash)
+    ctx = BarContext(dates, tickers, closes, book)
+    prices = np.nan_to_num(closes)
+    equity = np.empty(len(dates))
+    cash_curve = np.empty(len(dates))
+    for t in range(len(dates)):
+        ctx.t = t
+        strategy(ctx)
+        cash_curve[t] = book.cash
+        equity[t] = book.cash + float(book.shares @ prices[t])
+    return BacktestResult(dates, tickers, equity, cash_curve, book.trades, book.realized, cash)
+
+
+def run_vectorized(dates, tickers, closes, weights, cash=STARTING_CASH):
+    """
+    Signal-based backtest. weights is a days x tickers matrix of target portfolio
+    weights decided on each close; it is filled at the next close, and only on
+    days where the target changes. Rebalancing sells first, then buys whole shares
+    scaled down to the cash available. Share and cash paths are vectorized across
+    tickers; lots are matched FIFO afterwards for realized P&L.
+    """
+    n_days, n = closes.shape
+    weights = np.nan_to_num(np.asarray(weights, dtype=np.float64))
+    # a decision made on close t is executed on close t + 1
+    target_weights = np.vstack([np.zeros((1, n)), weights[:-1]]) if n_days else weights
+    changed = np.flatnonzero(np.any(np.diff(target_weights, axis=0, prepend=np.zeros((1, n))) != 0, axis=1))
+
+    shares = np.zeros(n, dtype=np.int64)
+    balance = float(cash)
+    rebalance_rows = np.zeros(n_days, dtype=bool)
+    shares_at = np.zeros((n_days, n), dtype=np.int64)
+    cash_at = np.full(n_days, balance)
+    fills = []  # (t, ticker index, signed qty, price)
+
+    for t in changed:
+        price = closes[t]
+        tradable = price > 0  # False for NaN
+        equity = balance + float(shares @ np.nan_to_num(price))
+        target = shares.copy()
+        target[tradable] = np.floor(target_weights[t, tradable] * equity / price[tradable])
+        delta = target - shares
+
+        sells = np.flatnonzero(delta < 0)
+        balance += float(-delta[sells] @ price[sells])
+        buys = np.flatnonzero(delta > 0)
+        cost = float(delta[buys] @ price[buys])
+        if cost > balance:
+            delta[buys] = np.floor(delta[buys] * (balance / cost))
+            buys = buys[delta[buys] > 0]
+            cost = float(delta[buys] @ price[buys])
+        balance -= cost
+        shares += delta
+
+        for j in np.concatenate([sells, buys]):
+            fills.append((t, j, int(delta[j]), float(price[j])))
+        rebalance_rows[t] = True
+        shares_at[t] = shares
+        cash_at[t] = balance
+
+    # carry each rebalance's shares and cash forward to the following bars
+    last = np.maximum.accumulate(np.where(rebalance_rows, np.arange(n_days), 0))
+    held = np.where(rebalance_rows[last][:, None], shares_at[last], 0)
+    cash_curve = np.where(rebalance_rows[last], cash_at[last], float(cash))
+    equity = cash_curve + np.einsum("ij,ij->i", held, np.nan_to_num(closes))
+
+    trades, realized = _match_fifo(dates, tickers, fills)
+    return BacktestResult(dates, tickers, equity, cash_curve, trades, realized, cash)
+
+
+def _match_fifo(dates, tickers, fills):
+    lots = {}
+    trades = []
+    realized = 0.0
+    for t, j, qty, price in fills:
+        ticker = tickers[j]
+        if qty > 0:
+            lots.setdefault(ticker, LotQueue()).append({"qty": qty, "price": price})
+            trades.append({"date": str(dates[t]), "ticker": ticker, "side": "buy", "qty": qty, "price": price, "pnl": 0.0})
+        else:
+            sold_lots = lots[ticker].consume(-qty)
+            pnl = sum((price - lot["buy_price"]) * lot["qty"] for lot in sold_lots)
+            realized += pnl
+            trades.append({"date": str(dates[t]), "ticker": ticker, "side": "sell", "qty": -qty, "price": price, "pnl": round(pnl, 2)})
+    return trades, realized
+
+
+# example strategies
+
+def buy_and_hold(dates, closes):
+    """Equal weight in every ticker from its first bar, never rebalanced for drift."""
+    listed = ~np.isnan(closes)
+    return np.where(listed, 1.0, 0.0) / np.maximum(listed.sum(axis=1, keepdims=True), 1)
+
+
+def sma_crossover(fast=50, slow=200):
+    """Equal weight across tickers whose fast moving average is above the slow one."""
+    def weights(dates, closes):
+        def sma(window):
+            filled = np.nan_to_num(closes)
+            sums = np.cumsum(filled, axis=0)
+            out = np.full(closes.shape, np.nan)
+            out[window - 1:] = (sums[window - 1:] - np.vstack([np.zeros((1, closes.shape[1])), sums[:-window]])) / window
+            return out
+        # windows that include pre-listing NaNs compare as False
+        listed = np.cumsum(~np.isnan(closes), axis=0) >= slow
+        signal = (sma(fast) > sma(slow)) & listed
+        return signal / np.maximum(signal.sum(axis=1, keepdims=True), 1)
+    return weights
+
+
+def dip_buyer(drop=0.05, take_profit=0.10, budget=0.10):
+    """
+    Event-driven example: after a one-day fall of `drop`, spend up to `budget`
+    of equity on that ticker; sell the whole position once it is `take_profit`
+    above its average cost.
+    """
+    cost_basis = {}
+
+    def on_bar(ctx):
+        for ticker in ctx.tickers:
+            closes = ctx.history(ticker, 2)
+            if len(closes) < 2 or not closes[-1] > 0 or not closes[-2] > 0:
+                continue
+            held = ctx.position(ticker)
+            price = closes[-1]
+            if held and price >= cost_basis[ticker] / held * (1 + take_profit):
+                ctx.sell(ticker, held)
+                cost_basis.pop(ticker)
+            elif closes[-1] / closes[-2] - 1 <= -drop:
+                qty = int(min(ctx.equity() * budget, ctx.cash) // price)
+                if ctx.buy(ticker, qty):
+                    cost_basis[ticker] = cost_basis.get(ticker, 0.0) + qty * price
+    return on_bar
+
+
+STRATEGIES = {
+    "hold": ("vectorized", buy_and_hold),
+    "sma": ("vectorized", sma_crossover()),
+    "dip": ("events", dip_buyer),
+}
+
+
+def run(tickers, strategy="hold", period="5y", cash=STARTING_CASH, bar_store=None):
+    """Loads closes for tickers and runs a named strategy from STRATEGIES."""
+    mode, factory = STRATEGIES[strategy]
+    dates, tickers, closes = load_closes(bar_store or _bar_store, tickers, period)
+    if mode == "vectorized":
+        return run_vectorized(dates, tickers, closes, factory(dates, closes), cash)
+    return run_events(dates, tickers, closes, factory(), cash)
+
+
+def print_result(result, max_trades=10):
+    stats = result.stats
+    if "start" not in stats:
+        console.print("[bold red]No price history for those tickers.[/bold red]")
+        return
+    table = Table(title=f"Backtest {stats['start']} → {stats['end']}", box=None, show_edge=True, header_style="bold white")
+    table.add_column("Metric", style="bold cyan", justify="left")
+    table.add_column("Value", style="bold green", justify="right")
+    table.add_row("Final Equity", f"${stats['final_equity']:,.2f}")
+    table.add_row("Total Return", f"{stats['total_return'] * 100:.2f}%")
+    table.add_row("CAGR", f"{stats['cagr'] * 100:.2f}%")
+    table.add_row("Volatility (annualized)", f"{stats['annual_volatility'] * 100:.2f}%")
+    table.add_row("Sharpe", f"{stats['sharpe']:.2f}")
+    table.add_row("Max Drawdown", f"{stats['max_drawdown'] * 100:.2f}%")
+    table.add_row("Trades", str(stats['trades']))
+    table.add_row("Realized P/L", f"${stats['realized_pnl']:,.2f}")
+    console.print(table)
+
+    for trade in result.trades[-max_trades:]:
+        color = "green" if trade["side"] == "buy" else "red"
+        console.print(f"  {trade['date']} [{color}]{trade['side']}[/{color}] {trade['qty']} {trade['ticker']} @ ${trade['price']:.2f}")
+
+
+def backtest(username):
+    tickers = [t.strip().upper() for t in ui.prompt("Enter tickers (comma separated): ").split(",") if t.strip()]
+    if not tickers:
+        console.print("[bold red]No tickers given.[/bold red]")
+        pause()
+        return
+    strategy = ui.prompt(f"Strategy [{'/'.join(STRATEGIES)}] (default hold): ").strip().lower() or "hold"
+    if strategy not in STRATEGIES:
+        console.print("[bold red]Unknown strategy.[/bold red]")
+        pause()
+        return
+    period = ui.prompt("Period (e.g. 1y, 5y, max; default 5y): ").strip().lower() or "5y"
+    try:
+        result = run(tickers, strategy, period)
+    except ValueError as e:
+        console.print(f"[bold red]{e}[/bold red]")
+        pause()
+        return
+    print_result(result)
+    pause()
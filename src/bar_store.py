@@ -0,0 +1,147 @@
+
+import json
+import os
+import time
+from datetime import date
+from threading import RLock
+
+import numpy as np
+
+from market_data import BAR_FIELDS, empty_bars, period_start
+import metrics
+from storage import DATA_DIR
+
+BARS_DIR = DATA_DIR / "bars"
+
+_DTYPES = {"date": np.int32, **{field: np.float64 for field in BAR_FIELDS}}
+_lock = RLock()
+
+
+class BarStore:
+    """
+    Append-only daily OHLCV store, one directory per ticker with one raw
+    column file per field (dates as int32 days since epoch, prices as float64).
+    Columns are memory-mapped on read; only completed sessions are stored and
+    each request fetches just the trailing days missing since the last bar.
+    """
+    def __init__(self, provider, root=BARS_DIR, refresh_after=6 * 3600):
+        self.provider = provider
+        self.root = root
+        self.refresh_after = refresh_after
+
+    def _dir(self, ticker):
+        return self.root / ticker.upper()
+
+    def _read_meta(self, ticker):
+        try:
+            with open(self._dir(ticker) / "meta.json", "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"rows": 0, "checked": 0}
+
+    def _write_meta(self, ticker, meta):
+        path = self._dir(ticker) / "meta.json"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def read(self, ticker):
+        """Returns the stored bars for ticker as memory-mapped arrays, without fetching."""
+        rows = self._read_meta(ticker)["rows"]
+        if rows == 0:
+            return empty_bars()
+        bars = {}
+        for field, dtype in _DTYPES.items():
+            bars[field] = np.memmap(self._dir(ticker) / f"{field}.bin", dtype=dtype, mode="r", shape=(rows,))
+        bars["date"] = bars["date"].astype("datetime64[D]")
+        return bars
+
+    def _append(self, ticker, bars, meta, rewrite=False):
+        directory = self._dir(ticker)
+        directory.mkdir(parents=True, exist_ok=True)
+        rows = 0 if rewrite else meta["rows"]
+        columns = dict(bars, date=bars["date"].astype("datetime64[D]").astype(np.int64))
+        for field, dtype in _DTYPES.items():
+            with open(directory / f"{field}.bin", "ab" if rows else "wb") as f:
+                # drop any tail left behind by an interrupted append
+                f.truncate(rows * np.dtype(dtype).itemsize)
+                f.write(np.asarray(columns[field], dtype=dtype).tobytes())
+        meta["rows"] = rows + len(bars["date"])
+        if len(bars["date"]):
+            meta["last"] = int(columns["date"][-1])
+        elif rewrite:
+            meta.pop("last", None)
+
+    def top_up(self, ticker, period="1y"):
+        """
+        Fetches the trailing days missing for ticker (or its full period on first
+        use). Returns the ticker's metadata.
+        """
+        ticker = ticker.upper()
+        with _lock:
+            meta = self._read_meta(ticker)
+            today = np.datetime64(date.today(), "D")
+            start = period_start(period)
+            since = start.isoformat() if start else ""
+            covered = meta["rows"] > 0 and meta.get("since", "~") <= since
+
+            if covered and time.time() - meta["checked"] < self.refresh_after:
+                return meta
+            if covered:
+                last = self.read(ticker)["date"][-1]
+                if last >= today - 1:
+                    meta["checked"] = time.time()
+                    self._write_meta(ticker, meta)
+                    return meta
+                metrics.incr("provider.history_requests")
+                with metrics.timer("bars.fetch"):
+                    bars = self.provider.get_history(ticker, start=(last + 1).astype(date))
+                keep = (bars["date"] > last) & (bars["date"] < today)
+                rewrite = False
+            else:
+                metrics.incr("provider.history_requests")
+                with metrics.timer("bars.fetch"):
+                    bars = self.provider.get_history(ticker, period=period)
+                keep = bars["date"] < today
+                rewrite = True
+                meta["since"] = since
+
+            bars = {k: v[keep] for k, v in bars.items()}
+            if len(bars["date"]) or rewrite:
+                self._append(ticker, bars, meta, rewrite=rewrite)
+            meta["checked"] = time.time()
+            self._write_meta(ticker, meta)
+            return meta
+
+    def stamp(self, ticker, period="1y"):
+        """
+        Tops up ticker and returns (rows, last bar, since) from its metadata
+        without reading any column; it changes whenever the stored series does.
+        """
+        meta = self.top_up(ticker, period)
+        return meta["rows"], meta.get("last"), meta.get("since")
+
+    def get_bars(self, ticker, period="1y"):
+        """Returns bars covering period for ticker, topping up the store first."""
+        self.top_up(ticker, period)
+        bars = self.read(ticker)
+        if period == "max" or not len(bars["date"]):
+            return bars
+        # anchor on the last stored session so replayed (historical) data slices the same way
+        start = period_start(period, bars["date"][-1].astype(date))
+        first = int(np.searchsorted(bars["date"], np.datetime64(start, "D")))
+        return {k: v[first:] for k, v in bars.items()}
+
+    def get_closes(self, ticker, period="1y"):
+        bars = self.get_bars(ticker, period)
+        return bars["date"], bars["close"]
+
+    def invalidate(self, ticker):
+        """Forces the next request for ticker to check for new bars."""
+        with _lock:
+            meta = self._read_meta(ticker)
+            if meta["rows"]:
+                meta["checked"] = 0
+                self._write_meta(ticker, meta)
+
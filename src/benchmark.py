@@ -0,0 +1,308 @@
+
+import argparse
+import builtins
+import copy
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from market_data import SyntheticProvider
+
+SRC_DIR = Path(__file__).resolve().parent
+BENCHMARK = "SPY"
+
+
+def synthetic_book(provider, users=10_000, tickers=500, lots=100_000, whale_lots=10_000, seed=0):
+    """
+    Generates {username: user record} for `users` accounts holding `lots` lots
+    spread over `tickers` symbols. Users and tickers are drawn so a few symbols
+    are widely held and lot counts vary by user, like a real book. The extra user
+    'whale' holds whale_lots lots of the most popular ticker, for FIFO sells.
+    Lot prices are the current quote +-40%, so P&L is mixed.
+    """
+    rng = np.random.default_rng(seed)
+    symbols = [f"S{i:03d}" for i in range(tickers)]
+    quotes = provider.get_quotes(symbols)
+    sectors = {t: provider.get_info(t)["sector"] for t in symbols}
+    popularity = 1.0 / np.arange(1, tickers + 1) ** 0.8
+
+    lot_user = rng.integers(0, users, lots)
+    lot_ticker = rng.choice(tickers, lots, p=popularity / popularity.sum())
+    lot_qty = rng.integers(1, 100, lots)
+    lot_price = np.round(np.array([quotes[symbols[i]] for i in lot_ticker]) * rng.uniform(0.6, 1.4, lots), 2)
+    cash = np.round(rng.uniform(1_000, 50_000, users), 2)
+
+    book = {f"user{u:05d}": {"name": f"user{u:05d}", "cash_balance": float(cash[u]), "holdings": {}}
+            for u in range(users)}
+    for u, t, qty, price in zip(lot_user.tolist(), lot_ticker.tolist(), lot_qty.tolist(), lot_price.tolist()):
+        ticker = symbols[t]
+        holdings = book[f"user{u:05d}"]["holdings"]
+        holdings.setdefault(ticker, []).append({"qty": qty, "price": price, "sector": sectors[ticker]})
+
+    if whale_lots:
+        ticker = symbols[0]
+        prices = np.round(quotes[ticker] * rng.uniform(0.6, 1.4, whale_lots), 2)
+        book["whale"] = {"name": "whale", "cash_balance": 1_000_000.0, "holdings": {ticker: [
+            {"qty": 1, "price": float(price), "sector": sectors[ticker]} for price in prices]}}
+    return symbols, book
+
+
+def summarize(samples):
+    ms = np.array(samples) * 1000
+    return {
+        "n": len(ms),
+        "min_ms": round(float(ms.min()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "total_ms": round(float(ms.sum()), 3),
+    }
+
+
+def timed(fn, args=(None,), setup=None):
+    """Times fn(arg) once per arg, running setup(arg) (untimed) before each call."""
+    samples = []
+    for arg in args:
+        if setup is not None:
+            setup(arg)
+        started = perf_counter()
+        fn(arg)
+        samples.append(perf_counter() - started)
+    return summarize(samples)
+
+
+@contextmanager
+def scripted_input(answers):
+    """Feeds answers to input() prompts, for the interactive commands."""
+    answers = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt="": next(answers)
+    try:
+        yield
+    finally:
+        builtins.input = original
+
+
+def tree_bytes(path):
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """
+    Builds the synthetic book in the current directory's data/ with the chosen
+    storage backend and times the hot paths. Returns the results dict.
+    """
+    # storage and the caches create data/ relative to the working directory on import
+    import storage
+    import snapshot
+    import ui
+    import utils
+    import analytics
+    import insights
+    import leaderboard
+    import price_fetcher as price_fetcher_module
+    import ledger as ledger_module
+    from price_fetcher import PriceFetcher
+    from bar_store import BarStore
+    from fundamentals import FundamentalsCache
+    from risk import RiskEngine
+    from orders import OrderEngine
+
+    ui.set_headless(True)
+    devnull = open(os.devnull, "w")
+    for module in (utils, analytics, insights, leaderboard, price_fetcher_module, ledger_module):
+        module.console.file = devnull
+
+    provider = SyntheticProvider(seed=args.seed)
+    fetcher = PriceFetcher(ttl=3600, provider=provider)
+    bar_store = BarStore(provider)
+    fundamentals = FundamentalsCache(provider)
+    risk = RiskEngine(bar_store, benchmark=BENCHMARK)
+    ledger = ledger_module.Ledger()
+
+    setup = {}
+    started = perf_counter()
+    symbols, book = synthetic_book(provider, args.users, args.tickers, args.lots, args.whale_lots, args.seed)
+    setup["generate_ms"] = round((perf_counter() - started) * 1000, 3)
+
+    store = storage.open_storage(args.storage)
+    started = perf_counter()
+    store.commit([store.next_event("put", username, data=user) for username, user in book.items()])
+    store.save_portfolios()
+    setup["write_ms"] = round((perf_counter() - started) * 1000, 3)
+    setup["data_bytes"] = tree_bytes(storage.DATA_DIR)
+
+    orders = OrderEngine(store, fetcher, fundamentals, ledger=ledger)
+    utils.init(store, fetcher, fundamentals=fundamentals, order_engine=orders)
+    analytics.init(store, fetcher, bar_store=bar_store, fundamentals=fundamentals, risk_engine=risk)
+    insights.init(store, fetcher, fundamentals=fundamentals)
+    leaderboard.init(store, fetcher)
+
+    rng = np.random.default_rng(args.seed + 1)
+    usernames = [u for u in book if u != "whale" and book[u]["holdings"]]
+    sample = [usernames[i] for i in rng.choice(len(usernames), min(args.sample, len(usernames)), replace=False)]
+    repeat = [None] * args.repeat
+    results = {}
+
+    def fresh_store(_):
+        fresh_store.instance = storage.open_storage(args.storage)
+
+    results["storage.load_portfolios"] = timed(lambda _: fresh_store.instance.load_portfolios(), repeat, fresh_store)
+    if args.storage == "json":
+        results["storage.save_portfolios"] = timed(lambda _: store.save_portfolios(), repeat)
+    else:
+        # sqlite and sharded persist in every commit(); their save_portfolios writes no snapshot
+        results["storage.save_portfolios"] = {"n/a": "persisted by every commit()"}
+
+    results["prices.get_prices[cold]"] = timed(lambda _: fetcher.get_prices(symbols), repeat,
+                                               lambda _: fetcher.invalidate())
+    results["prices.get_prices[warm]"] = timed(lambda _: fetcher.get_prices(symbols), repeat)
+
+    # snapshots are memoized per user; drop them so each call derives its view from scratch
+    cold = snapshot.invalidate
+    results["analytics.portfolio_value"] = timed(analytics.portfolio_value, sample, cold)
+    results["analytics.portfolio_pnl"] = timed(analytics.portfolio_pnl, sample, cold)
+    results["insights.generate_insights"] = timed(insights.generate_insights, sample, cold)
+
+    results["leaderboard.build"] = timed(lambda _: leaderboard.build(), repeat)
+
+    started = perf_counter()
+    for ticker in [*symbols, BENCHMARK]:
+        bar_store.get_closes(ticker, risk.period)
+    setup["bar_store_fill_ms"] = round((perf_counter() - started) * 1000, 3)
+    results["analytics.portfolio_risk_metrics"] = timed(analytics.portfolio_risk_metrics, sample[:args.risk_sample],
+                                                        lambda u: (cold(u), risk.invalidate()))
+
+    def sell_half(username):
+        user = store.get_user(username)
+        ticker = max(user["holdings"], key=lambda t: int(sum(lot["qty"] for lot in user["holdings"][t])))
+        qty = max(int(sum(lot["qty"] for lot in user["holdings"][ticker])) // 2, 1)
+        with scripted_input([ticker, str(qty)]):
+            fill = utils.sell(username)
+        if fill is None or fill["status"] != "filled":
+            raise RuntimeError(f"Benchmark sell failed for {username}: {fill}")
+        return fill
+
+    results["utils.sell"] = timed(sell_half, sample)
+
+    # what persisting one trade costs on each backend: a single-event commit
+    def commit_buy(username):
+        user = store.get_user(username)
+        ticker = next(iter(user["holdings"]))
+        lot = {"qty": 1, "price": 1.0, "sector": "Unknown"}
+        store.commit([store.next_event("buy", username, ticker=ticker, lot=lot, cash=user["cash_balance"])])
+
+    results["storage.commit"] = timed(commit_buy, sample)
+    if "whale" in book:
+        ticker = next(iter(book["whale"]["holdings"]))
+        qty = args.whale_lots - 1
+        whale = {}
+
+        def restore_whale(_):
+            store.commit([store.next_event("put", "whale", data=copy.deepcopy(book["whale"]))])
+
+        # the FIFO consumption and its commit alone, with nothing printed
+        def sell_whale(_):
+            whale["fill"] = orders.execute_one("whale", "sell", ticker, qty)
+            if whale["fill"]["status"] != "filled":
+                raise RuntimeError(f"Benchmark sell failed for whale: {whale['fill']}")
+
+        results["orders.sell[whale]"] = timed(sell_whale, repeat, restore_whale)
+        results["orders.sell[whale]"]["lots_consumed"] = len(whale["fill"]["lots"])
+
+        # the interactive command on the same position; mostly the per-lot console lines
+        def sell_whale_command(_):
+            with scripted_input([ticker, str(qty)]):
+                whale["fill"] = utils.sell("whale")
+
+        results["utils.sell[whale]"] = timed(sell_whale_command, setup=restore_whale)
+        results["utils.sell[whale]"]["lots_consumed"] = len(whale["fill"]["lots"])
+
+    devnull.close()
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "storage": args.storage,
+            "users": args.users,
+            "tickers": args.tickers,
+            "lots": args.lots,
+            "whale_lots": args.whale_lots,
+            "sample": len(sample),
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "setup": setup,
+        "results": results,
+    }
+
+
+def compare(results, baseline):
+    """Adds each case's p50 change vs a previous run's JSON (ratio > 1 is slower)."""
+    for name, stats in results["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before and before.get("p50_ms") and stats.get("p50_ms"):
+            stats["p50_vs_baseline"] = round(stats["p50_ms"] / before["p50_ms"], 3)
+    results["meta"]["baseline_commit"] = baseline.get("meta", {}).get("commit")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="TradeLab synthetic-load benchmarks (JSON results on stdout)")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--lots", type=int, default=100_000)
+    parser.add_argument("--whale-lots", type=int, default=10_000, help="lots in one position consumed by a single FIFO sell")
+    parser.add_argument("--storage", default="json", choices=("json", "sqlite", "sharded"))
+    parser.add_argument("--sample", type=int, default=200, help="users timed by the per-user cases")
+    parser.add_argument("--risk-sample", type=int, default=50, help="users timed by portfolio_risk_metrics")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of the whole-book cases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="directory for the generated data (default: a temporary one, removed after)")
+    parser.add_argument("--out", help="also write the results to this file")
+    parser.add_argument("--baseline", help="previous results file to compare p50 timings against")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="tradelab-bench-")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    cwd = os.getcwd()
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    os.chdir(workdir)
+    try:
+        results = run(args)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if baseline:
+        compare(results, baseline)
+    output = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(output + "\n")
+    print(output)
+    sys.exit(0)
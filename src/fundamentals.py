@@ -0,0 +1,130 @@
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
+
+import metrics
+from storage import DATA_DIR
+
+FUNDAMENTALS_PATH = DATA_DIR / "fundamentals.json"
+
+# seconds each field stays fresh; sector rarely changes, valuation ratios move daily
+FIELD_TTLS = {
+    "sector": 30 * 86400,
+    "trailingPE": 86400,
+    "beta": 7 * 86400,
+    "marketCap": 86400,
+}
+
+_lock = RLock()
+
+
+class FundamentalsCache:
+    """
+    Reference data cache (sector, trailing P/E, beta, market cap) keyed by ticker.
+    Every field carries its own timestamp and TTL; the cache is persisted to
+    data/fundamentals.json so fresh values survive across sessions.
+    Stale tickers are fetched concurrently, at most max_workers at a time.
+    """
+    def __init__(self, provider, path=FUNDAMENTALS_PATH, ttls=None, max_workers=8):
+        self.provider = provider
+        self.path = path
+        self.ttls = dict(FIELD_TTLS, **(ttls or {}))
+        self.max_workers = max_workers
+        self._cache = None  # ticker -> {field: {"value": ..., "time": timestamp}}
+        self._executor = None
+
+    def _pool(self):
+        with _lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fundamentals")
+            return self._executor
+
+    def _load(self):
+        if self._cache is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._cache = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._cache = {}
+        return self._cache
+
+    def _save(self):
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._cache, f, indent=4)
+        os.replace(tmp, self.path)
+
+    def _is_fresh(self, entry, field, now):
+        return entry is not None and now - entry["time"] < self.ttls.get(field, 86400)
+
+    def stale(self, tickers, fields=None, now=None):
+        """Returns the tickers with at least one missing or expired field."""
+        fields = fields or list(self.ttls)
+        now = now or time.time()
+        with _lock:
+            cache = self._load()
+            return [t for t in tickers
+                    if not all(self._is_fresh(cache.get(t, {}).get(f), f, now) for f in fields)]
+
+    def _fetch_info(self, ticker):
+        """provider.get_info(ticker), or None if the request failed."""
+        metrics.incr("provider.info_requests")
+        try:
+            with metrics.timer("fundamentals.fetch"):
+                return self.provider.get_info(ticker)
+        except Exception:
+            metrics.incr("fundamentals.errors")
+            return None
+
+    def refresh(self, tickers, fields=None, force=False):
+        """Bulk refresh: fetches info once per stale ticker, concurrently, and persists a single time."""
+        tickers = list(dict.fromkeys(t.upper() for t in tickers))
+        todo = tickers if force else self.stale(tickers, fields)
+        if not todo:
+            return
+        infos = [self._fetch_info(todo[0])] if len(todo) == 1 else self._pool().map(self._fetch_info, todo)
+        fetched = {ticker: info for ticker, info in zip(todo, infos) if info is not None}
+        if not fetched:
+            return
+        now = time.time()
+        with _lock:
+            cache = self._load()
+            for ticker, info in fetched.items():
+                entry = cache.setdefault(ticker, {})
+                for field in self.ttls:
+                    # missing values are cached too, so ETFs without a P/E are not refetched
+                    entry[field] = {"value": info.get(field), "time": now}
+            self._save()
+
+    def get(self, ticker, field, default=None):
+        ticker = ticker.upper()
+        self.refresh([ticker], [field])
+        with _lock:
+            entry = self._load().get(ticker, {}).get(field)
+        if entry is None or entry["value"] is None:
+            return default
+        return entry["value"]
+
+    def get_many(self, tickers, field, default=None):
+        """Returns {ticker: value} for field, refreshing stale tickers in bulk first."""
+        tickers = [t.upper() for t in tickers]
+        self.refresh(tickers, [field])
+        with _lock:
+            cache = self._load()
+            values = {}
+            for ticker in tickers:
+                entry = cache.get(ticker, {}).get(field)
+                values[ticker] = default if entry is None or entry["value"] is None else entry["value"]
+        return values
+
+    def invalidate(self, ticker=None):
+        with _lock:
+            cache = self._load()
+            if ticker:
+                cache.pop(ticker.upper(), None)
+            else:
+                cache.clear()
+            self._save()
@@ -0,0 +1,73 @@
+
+from threading import Lock
+
+import numpy as np
+
+from positions import total_cost, total_qty
+
+_memo = {}  # username -> (version, HoldingsArrays)
+_memo_lock = Lock()
+
+
+class HoldingsArrays:
+    """
+    Columnar view of one user's holdings: per-ticker quantity, cost basis and
+    average cost as arrays aligned with `tickers`, so valuation is vectorized
+    against a price vector. Quantity and cost come from each LotQueue's running
+    totals, so building the view does not scale with the number of lots.
+    """
+    def __init__(self, holdings):
+        self.tickers = [ticker for ticker, lots in holdings.items() if lots]
+        self.index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        n = len(self.tickers)
+
+        self.qty = np.fromiter((total_qty(holdings[t]) for t in self.tickers), dtype=np.float64, count=n)
+        self.cost = np.fromiter((total_cost(holdings[t]) for t in self.tickers), dtype=np.float64, count=n)
+        self.avg_cost = np.divide(self.cost, self.qty, out=np.zeros(n), where=self.qty > 0)
+        self.sectors = [holdings[ticker][0].get('sector', 'Unknown') for ticker in self.tickers]
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def price_vector(self, prices):
+        """Aligns a {ticker: price or None} dict with `tickers`; missing prices become NaN."""
+        return np.array([np.nan if prices.get(t) is None else prices[t] for t in self.tickers], dtype=np.float64)
+
+    def priced(self, price_vec):
+        """Mask of positions that have a price and a non-zero quantity."""
+        return ~np.isnan(price_vec) & (self.qty != 0)
+
+    def market_value(self, price_vec):
+        """Per-ticker value; unpriced positions are 0."""
+        return np.where(self.priced(price_vec), np.nan_to_num(price_vec) * self.qty, 0.0)
+
+    def unrealized_pnl(self, price_vec):
+        return np.where(self.priced(price_vec), np.nan_to_num(price_vec) * self.qty - self.cost, 0.0)
+
+
+def for_user(user, username=None):
+    """
+    Returns HoldingsArrays for a user record, memoized on (username, version) so
+    the arrays are rebuilt only after storage committed a change for that user.
+    A record with no version yet (never changed since it was loaded) is version 0.
+    """
+    version = user.get("version", 0)
+    if username is None:
+        return HoldingsArrays(user.get("holdings", {}))
+    with _memo_lock:
+        cached = _memo.get(username)
+        if cached and cached[0] == version:
+            return cached[1]
+    arrays = HoldingsArrays(user.get("holdings", {}))
+    with _memo_lock:
+        _memo[username] = (version, arrays)
+    return arrays
+
+
+def invalidate(username=None):
+    """Drops the memoized arrays for username (or every user)."""
+    with _memo_lock:
+        if username is None:
+            _memo.clear()
+        else:
+            _memo.pop(username, None)
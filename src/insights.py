@@ -1,67 +1,47 @@
 
 import json
+import numpy as np
 from rich.console import Console
 
+import metrics
+import snapshot
+from fundamentals import FundamentalsCache
+from ui import pause
+
 console = Console()
 
 _storage = None
 _price_fetcher = None
+_fundamentals = None
 
-def init(storage, price_fetcher):
-    global _storage, _price_fetcher
+def init(storage, price_fetcher, fundamentals=None):
+    global _storage, _price_fetcher, _fundamentals
     _storage = storage
     _price_fetcher = price_fetcher
+    _fundamentals = fundamentals or FundamentalsCache(price_fetcher.provider)
 
-def get_price(ticker):
-    if _price_fetcher is None:
-        return None
-    return _price_fetcher.get_price(ticker)
-
+@metrics.timed()
 def generate_insights(username):
-    portfolios = _storage.load_portfolios()
-    if username not in portfolios:
+    snap = snapshot.get_snapshot(_storage, _price_fetcher, username)
+    if snap is None:
         console.print(f"[bold red]User '{username}' not found.[/bold red]")
-        input("Press Enter to return to main menu...")
+        pause()
         return
 
-    holdings = portfolios[username].get("holdings", {})
-    if not holdings:
+    if not snap.holdings:
         console.print("[bold yellow]No holdings in portfolio.[/bold yellow]")
-        input("Press Enter to return to main menu...")
-        return
+        pause()
+        return {"total_value": 0.0, "insights": []}
+
+    total_value = snap.total_value
+    # weighted like analytics.portfolio_valuation: positions without a P/E count as 0
+    pes = _fundamentals.get_many(snap.tickers, 'trailingPE')
+    pe_vec = np.array([pes.get(t) or 0.0 for t in snap.tickers], dtype=np.float64)
+    pe_sum = float(np.dot(np.where(pe_vec > 0, pe_vec, 0.0), snap.values))
 
-    total_value = 0.0
-    sector_alloc = {}
-    pe_sum = 0.0
-    pe_weight = 0.0
-    holding_values = {}
-
-    for ticker, lots in holdings.items():
-        qty = sum(int(lot.get('qty', 0)) for lot in lots)
-        price = get_price(ticker)
-        if price is None or qty == 0:
-            continue
-        value = float(price) * qty
-        total_value += value
-        holding_values[ticker] = value
-
-        sector = lots[0].get('sector', 'Unknown') if lots else 'Unknown'
-        sector_alloc[sector] = sector_alloc.get(sector, 0) + value
-
-        pe = None
-        for lot in lots:
-            lot_pe = lot.get('pe')
-            if lot_pe is not None and lot_pe > 0:
-                pe = lot_pe
-                break
-        if pe is not None:
-            pe_sum += pe * value
-            pe_weight += value
-
-    avg_pe = round(pe_sum / pe_weight, 2) if pe_weight > 0 else 0
-    sector_percent = {k: round(v / total_value * 100, 2) for k, v in sector_alloc.items()} if total_value > 0 else {}
-
-    top_holdings = sorted(holding_values.items(), key=lambda x: x[1], reverse=True)
+    avg_pe = round(pe_sum / total_value, 2) if total_value > 0 else 0
+    sector_percent = snap.sector_weights
+    top_holdings = snap.top_holdings
 
     insights = []
 
@@ -92,5 +72,11 @@ def generate_insights(username):
         color = "yellow" if "Warning" in insight else "green"
         console.print(f"- [{color}]{insight}[/{color}]")
 
-    input("\nPress Enter to return to main menu...")
-    return
\ No newline at end of file
+    pause("\nPress Enter to return to main menu...")
+    return {
+        "total_value": round(total_value, 2),
+        "sector_allocation": sector_percent,
+        "top_holdings": [h[0] for h in top_holdings[:3]],
+        "weighted_pe": avg_pe,
+        "insights": insights,
+    }
\ No newline at end of file
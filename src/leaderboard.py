@@ -0,0 +1,202 @@
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+import metrics
+from positions import total_cost, total_qty
+from storage import STARTING_CASH
+from ui import pause
+
+console = Console()
+
+RANK_BY = ("return", "equity", "pnl", "concentration")
+
+_storage = None
+_price_fetcher = None
+
+def init(storage, price_fetcher):
+    global _storage, _price_fetcher
+    _storage = storage
+    _price_fetcher = price_fetcher
+
+
+class Leaderboard:
+    """
+    Every account's value, returns and concentration, computed together: the
+    union of held tickers is priced in one get_prices call and all positions are
+    valued as one flat array, then summed per user with bincount. Arrays are
+    aligned with `usernames`; unpriced positions count as zero value.
+      equity         holdings value + cash
+      return         equity vs the starting cash every account gets
+      pnl / pnl_pct  unrealized P&L of priced positions, and vs their cost
+      concentration  Herfindahl index of position weights (1 = a single stock)
+      top_weight     largest position's share of holdings value
+      sector         sector holding most of the user's value ('Cash' if none)
+    """
+    def __init__(self, portfolios, price_fetcher):
+        portfolios = list(portfolios.items())
+        self.usernames = [username for username, _ in portfolios]
+        self.names = [user.get("name", username) for username, user in portfolios]
+        self.index = {username: i for i, username in enumerate(self.usernames)}
+        n = len(portfolios)
+        self.cash = np.fromiter((float(user.get("cash_balance", 0.0)) for _, user in portfolios), dtype=np.float64, count=n)
+
+        # one row per (user, ticker) position
+        tickers = {}
+        sectors = {}
+        pos_user, pos_ticker, pos_sector, pos_qty, pos_cost = [], [], [], [], []
+        for i, (_, user) in enumerate(portfolios):
+            for ticker, lots in user.get("holdings", {}).items():
+                if not lots:
+                    continue
+                pos_user.append(i)
+                pos_ticker.append(tickers.setdefault(ticker, len(tickers)))
+                pos_sector.append(sectors.setdefault(lots[0].get("sector", "Unknown"), len(sectors)))
+                pos_qty.append(total_qty(lots))
+                pos_cost.append(total_cost(lots))
+        self.tickers = list(tickers)
+        self.sectors = list(sectors)
+        pos_user = np.array(pos_user, dtype=np.intp)
+        pos_ticker = np.array(pos_ticker, dtype=np.intp)
+        pos_sector = np.array(pos_sector, dtype=np.intp)
+        qty = np.array(pos_qty, dtype=np.float64)
+        cost = np.array(pos_cost, dtype=np.float64)
+
+        prices = price_fetcher.get_prices(self.tickers) if self.tickers else {}
+        price_vec = np.array([np.nan if prices.get(t) is None else prices[t] for t in self.tickers], dtype=np.float64)
+        pos_price = price_vec[pos_ticker]
+        priced = ~np.isnan(pos_price) & (qty != 0)
+        values = np.where(priced, np.nan_to_num(pos_price) * qty, 0.0)
+        priced_cost = np.where(priced, cost, 0.0)
+
+        self.positions = np.bincount(pos_user, minlength=n)
+        self.value = np.bincount(pos_user, weights=values, minlength=n)
+        self.cost = np.bincount(pos_user, weights=priced_cost, minlength=n)
+        self.equity = self.value + self.cash
+        self.return_ = self.equity / STARTING_CASH - 1
+        self.pnl = self.value - self.cost
+        self.pnl_pct = np.divide(self.pnl, self.cost, out=np.zeros(n), where=self.cost > 0)
+
+        weights = np.divide(values, self.value[pos_user], out=np.zeros(len(values)), where=self.value[pos_user] > 0)
+        self.concentration = np.bincount(pos_user, weights=weights ** 2, minlength=n)
+        self.top_weight = np.zeros(n)
+        np.maximum.at(self.top_weight, pos_user, weights)
+
+        by_sector = np.zeros((n, max(len(self.sectors), 1)))
+        np.add.at(by_sector, (pos_user, pos_sector), values)
+        self.sector_index = np.where(self.value > 0, by_sector.argmax(axis=1), -1)
+
+    def __len__(self):
+        return len(self.usernames)
+
+    def metric(self, by):
+        if by not in RANK_BY:
+            raise ValueError(f"Unknown ranking '{by}'. Choose from: {', '.join(RANK_BY)}")
+        return {"return": self.return_, "equity": self.equity, "pnl": self.pnl, "concentration": self.concentration}[by]
+
+    def order(self, by="return"):
+        """User indices best first; lower concentration ranks higher, ties keep storage order."""
+        values = self.metric(by)
+        return np.argsort(values if by == "concentration" else -values, kind="stable")
+
+    def ranks(self, by="return"):
+        """1-based rank of every user, aligned with usernames."""
+        ranks = np.empty(len(self), dtype=np.int64)
+        ranks[self.order(by)] = np.arange(1, len(self) + 1)
+        return ranks
+
+    def row(self, i, rank=None):
+        return {
+            "rank": rank,
+            "user": self.usernames[i],
+            "name": self.names[i],
+            "equity": round(float(self.equity[i]), 2),
+            "return": round(float(self.return_[i]), 4),
+            "pnl": round(float(self.pnl[i]), 2),
+            "pnl_pct": round(float(self.pnl_pct[i]), 4),
+            "positions": int(self.positions[i]),
+            "concentration": round(float(self.concentration[i]), 4),
+            "top_weight": round(float(self.top_weight[i]), 4),
+            "sector": self.sectors[self.sector_index[i]] if self.sector_index[i] >= 0 else "Cash",
+        }
+
+    def top(self, by="return", limit=10):
+        return [self.row(i, rank) for rank, i in enumerate(self.order(by)[:limit], start=1)]
+
+    def cohorts(self):
+        """Per main-sector cohort: members, median / mean return, mean equity and concentration."""
+        groups = self.sector_index + 1  # 0 is the all-cash cohort
+        labels = ["Cash", *self.sectors]
+        counts = np.bincount(groups, minlength=len(labels))
+        result = []
+        for g in np.flatnonzero(counts):
+            members = groups == g
+            result.append({
+                "cohort": labels[g],
+                "users": int(counts[g]),
+                "median_return": round(float(np.median(self.return_[members])), 4),
+                "mean_return": round(float(self.return_[members].mean()), 4),
+                "mean_equity": round(float(self.equity[members].mean()), 2),
+                "mean_concentration": round(float(self.concentration[members].mean()), 4),
+            })
+        result.sort(key=lambda c: (-c["users"], c["cohort"]))
+        return result
+
+
+@metrics.timed()
+def build(storage=None, price_fetcher=None):
+    """Computes the Leaderboard for every account in storage."""
+    return Leaderboard((storage or _storage).load_portfolios(), price_fetcher or _price_fetcher)
+
+
+def leaderboard(username, by="return", limit=10):
+    board = build()
+    if not len(board):
+        console.print("[bold yellow]No accounts yet.[/bold yellow]")
+        pause()
+        return {"users": 0, "top": [], "you": None, "cohorts": []}
+
+    top = board.top(by, limit)
+    you = None
+    if username in board.index:
+        i = board.index[username]
+        you = board.row(i, int(board.ranks(by)[i]))
+
+    def pct(value):
+        color = "green" if value >= 0 else "red"
+        return f"[{color}]{value * 100:.2f}%[/{color}]"
+
+    table = Table(title=f"Leaderboard ({len(board):,} accounts, by {by})", box=None, show_edge=True, header_style="bold white")
+    table.add_column("#", style="bold white", justify="right")
+    table.add_column("User", style="bold cyan", justify="left")
+    table.add_column("Equity", style="bold green", justify="right")
+    table.add_column("Return", justify="right")
+    table.add_column("Unrealized", justify="right")
+    table.add_column("Top Pos%", style="bold magenta", justify="right")
+    table.add_column("Sector", style="bold blue", justify="left")
+    rows = top + ([you] if you and you["rank"] > limit else [])
+    for row in rows:
+        style = "reverse" if row["user"] == username else None
+        table.add_row(str(row["rank"]), row["name"], f"${row['equity']:,.2f}", pct(row["return"]),
+                      pct(row["pnl_pct"]), f"{row['top_weight'] * 100:.1f}%", row["sector"], style=style)
+    console.print("\n")
+    console.print(table)
+
+    cohorts = board.cohorts()
+    cohort_table = Table(title="Cohorts by main sector", box=None, show_edge=True, header_style="bold white")
+    cohort_table.add_column("Cohort", style="bold cyan", justify="left")
+    cohort_table.add_column("Users", style="bold white", justify="right")
+    cohort_table.add_column("Median Return", justify="right")
+    cohort_table.add_column("Mean Equity", style="bold green", justify="right")
+    cohort_table.add_column("Concentration", style="bold magenta", justify="right")
+    for cohort in cohorts:
+        cohort_table.add_row(cohort["cohort"], f"{cohort['users']:,}", pct(cohort["median_return"]),
+                             f"${cohort['mean_equity']:,.2f}", f"{cohort['mean_concentration']:.3f}")
+    console.print("\n")
+    console.print(cohort_table)
+
+    if you:
+        console.print(f"\n[bold white]Your rank:[/bold white] [bold cyan]{you['rank']:,}[/bold cyan] of {len(board):,}")
+    pause()
+    return {"users": len(board), "tickers": len(board.tickers), "by": by, "top": top, "you": you, "cohorts": cohorts}
@@ -0,0 +1,217 @@
+
+import shutil
+from datetime import date
+from threading import RLock
+from urllib.parse import quote
+
+import numpy as np
+from rich.console import Console
+
+from storage import DATA_DIR
+from ui import pause
+
+console = Console()
+
+LEDGER_DIR = DATA_DIR / "ledger"
+
+# one fixed-width record per fill; cum_pnl is the running realized total
+FILL_DTYPE = np.dtype([
+    ("day", "<i4"), ("side", "S4"), ("ticker", "S12"), ("qty", "<i8"),
+    ("price", "<f8"), ("cost", "<f8"), ("pnl", "<f8"), ("cum_pnl", "<f8"),
+])
+# one fixed-width record per day; index is the time-weighted growth of 1 since
+# the first record, peak / max_drawdown are carried forward incrementally
+EQUITY_DTYPE = np.dtype([
+    ("day", "<i4"), ("equity", "<f8"), ("index", "<f8"), ("peak", "<f8"), ("max_drawdown", "<f8"),
+])
+
+_lock = RLock()
+
+
+def _today():
+    return int(np.datetime64(date.today(), "D").astype(np.int64))
+
+
+class Ledger:
+    """
+    Per-user append-only history under data/ledger/<user>/:
+      fills.bin   realized P&L ledger, one FILL_DTYPE record per executed order
+      equity.bin  end-of-day equity curve, one EQUITY_DTYPE record per day
+    Records are fixed width, so the latest ones are read by offset and the files
+    are memory-mapped for history views. Each day's equity record is derived
+    from the previous day's, so TWR, drawdown and running realized P&L are O(1)
+    reads and MTD / YTD a binary search, however long the history.
+    """
+    def __init__(self, root=LEDGER_DIR):
+        self.root = root
+
+    def _path(self, username, name):
+        return self.root / quote(username, safe="") / name
+
+    def _read(self, path, dtype, tail=None):
+        """Memory-maps the records in path, or reads just the last `tail` of them."""
+        try:
+            rows = path.stat().st_size // dtype.itemsize
+        except FileNotFoundError:
+            return np.zeros(0, dtype=dtype)
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        if tail:
+            start = rows - min(tail, rows)
+            return np.fromfile(path, dtype=dtype, count=rows - start, offset=start * dtype.itemsize)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+    def _write(self, path, record, replace_last=False):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = path.stat().st_size if path.exists() else 0
+        with open(path, "r+b" if size else "wb") as f:
+            # a torn record from an interrupted write is dropped
+            end = size - size % record.itemsize
+            if replace_last and end:
+                end -= record.itemsize
+            f.truncate(end)
+            f.seek(end)
+            f.write(record.tobytes())
+
+    # realized P&L
+    def record_fills(self, fills, day=None):
+        """Appends the filled orders from OrderEngine.execute reports."""
+        day = _today() if day is None else day
+        with _lock:
+            for fill in fills:
+                if fill.get("status") != "filled":
+                    continue
+                path = self._path(fill["user"], "fills.bin")
+                last = self._read(path, FILL_DTYPE, tail=1)
+                pnl = fill.get("realized_pnl", 0.0)
+                cost = sum(lot["qty"] * lot["buy_price"] for lot in fill.get("lots", []))
+                record = np.array([(
+                    day, fill["side"], fill["ticker"], fill["qty"], fill["price"],
+                    cost if fill["side"] == "sell" else fill["qty"] * fill["price"],
+                    pnl, (float(last["cum_pnl"][0]) if len(last) else 0.0) + pnl,
+                )], dtype=FILL_DTYPE)
+                self._write(path, record)
+
+    def fills(self, username):
+        return self._read(self._path(username, "fills.bin"), FILL_DTYPE)
+
+    def realized_pnl(self, username):
+        last = self._read(self._path(username, "fills.bin"), FILL_DTYPE, tail=1)
+        return float(last["cum_pnl"][0]) if len(last) else 0.0
+
+    # equity curve
+    def mark(self, username, equity, day=None):
+        """
+        Records username's equity for day (default today). Repeated marks on the
+        same day overwrite that day's record, so the last one is the close.
+        """
+        day = _today() if day is None else day
+        path = self._path(username, "equity.bin")
+        with _lock:
+            tail = self._read(path, EQUITY_DTYPE, tail=2)
+            replace = len(tail) > 0 and tail["day"][-1] == day
+            previous = tail[:-1] if replace else tail
+            if len(previous) and previous["day"][-1] > day:
+                return
+            if len(previous):
+                prev = previous[-1]
+                ret = equity / prev["equity"] - 1 if prev["equity"] > 0 else 0.0
+                index = prev["index"] * (1 + ret)
+                peak = max(prev["peak"], index)
+                max_drawdown = min(prev["max_drawdown"], index / peak - 1)
+            else:
+                index, peak, max_drawdown = 1.0, 1.0, 0.0
+            record = np.array([(day, equity, index, peak, max_drawdown)], dtype=EQUITY_DTYPE)
+            self._write(path, record, replace_last=replace)
+
+    def equity_history(self, username):
+        return self._read(self._path(username, "equity.bin"), EQUITY_DTYPE)
+
+    def performance(self, username, day=None):
+        """
+        Daily change, MTD / YTD / since-inception time-weighted returns and max
+        drawdown from the equity curve, plus running realized P&L.
+        """
+        history = self.equity_history(username)
+        result = {
+            "equity": None, "daily_change": 0.0, "daily_return": 0.0,
+            "mtd": 0.0, "ytd": 0.0, "twr": 0.0, "max_drawdown": 0.0,
+            "since": None, "realized_pnl": self.realized_pnl(username),
+        }
+        if not len(history):
+            return result
+        last = history[-1]
+        day = np.datetime64(int(last["day"]) if day is None else day, "D")
+
+        def since(start):
+            # growth since the close before start (the first record if history begins later)
+            i = int(np.searchsorted(history["day"], int(start.astype(np.int64)))) - 1
+            return float(last["index"] / history["index"][max(i, 0)] - 1)
+
+        result.update(
+            equity=float(last["equity"]),
+            mtd=since(day.astype("datetime64[M]").astype("datetime64[D]")),
+            ytd=since(day.astype("datetime64[Y]").astype("datetime64[D]")),
+            twr=float(last["index"] - 1),
+            max_drawdown=float(last["max_drawdown"]),
+            since=str(np.datetime64(int(history["day"][0]), "D")),
+        )
+        if len(history) > 1:
+            prev = history[-2]
+            result["daily_change"] = float(last["equity"] - prev["equity"])
+            result["daily_return"] = float(last["index"] / prev["index"] - 1)
+        return result
+
+    def reset(self, username):
+        """Drops a user's history, e.g. after their portfolio is reset."""
+        with _lock:
+            shutil.rmtree(self.root / quote(username, safe=""), ignore_errors=True)
+
+
+_ledger = None
+
+def init(ledger=None):
+    global _ledger
+    _ledger = ledger or Ledger()
+
+
+def history(username, recent=10):
+    perf = _ledger.performance(username)
+    fills = _ledger.fills(username)
+    if perf["equity"] is None and not len(fills):
+        console.print("[bold yellow]No history recorded yet.[/bold yellow]")
+        pause()
+        return {**perf, "fills": []}
+
+    def pct(value):
+        color = "green" if value >= 0 else "red"
+        return f"[bold {color}]{value * 100:.2f}%[/bold {color}]"
+
+    if perf["equity"] is not None:
+        console.print(f"[bold white]Equity:[/bold white] [bold green]${perf['equity']:,.2f}[/bold green] [white](history since {perf['since']})[/white]")
+        console.print(f"[bold white]Daily Return:[/bold white] {pct(perf['daily_return'])} [white](${perf['daily_change']:,.2f})[/white]")
+        console.print(f"[bold white]MTD / YTD:[/bold white] {pct(perf['mtd'])} / {pct(perf['ytd'])}")
+        console.print(f"[bold white]Time-Weighted Return:[/bold white] {pct(perf['twr'])}")
+        console.print(f"[bold white]Max Drawdown:[/bold white] {pct(perf['max_drawdown'])}")
+    color = "green" if perf["realized_pnl"] >= 0 else "red"
+    console.print(f"[bold white]Realized P/L:[/bold white] [bold {color}]${perf['realized_pnl']:,.2f}[/bold {color}]")
+
+    rows = []
+    for record in fills[-recent:]:
+        rows.append({
+            "date": str(np.datetime64(int(record["day"]), "D")),
+            "side": record["side"].decode(),
+            "ticker": record["ticker"].decode(),
+            "qty": int(record["qty"]),
+            "price": float(record["price"]),
+            "pnl": round(float(record["pnl"]), 2),
+        })
+    if rows:
+        console.print("\n[bold underline white]Recent Fills:[/bold underline white]")
+    for row in rows:
+        color = "green" if row["side"] == "buy" else "red"
+        pnl = f" | P/L: ${row['pnl']:,.2f}" if row["side"] == "sell" else ""
+        console.print(f"  {row['date']} [{color}]{row['side']}[/{color}] {row['qty']} {row['ticker']} @ ${row['price']:.2f}{pnl}")
+
+    pause()
+    return {**perf, "fills": rows}
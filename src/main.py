@@ -1,179 +1,410 @@
 
-from time import sleep
-from os import name as os_name, system
-from rich.console import Console
+import argparse
+import atexit
+import json
+import subprocess
+import sys
+from functools import lru_cache
+from pathlib import Path
+from datetime import date
+from time import perf_counter, sleep
+from os import environ
+from rich.console import Console, Group
 from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
 from rich import box
-from pyfiglet import Figlet
 from rich.align import Align
+from rich.rule import Rule
 
 import storage
 from price_fetcher import PriceFetcher
+from bar_store import BarStore
+from fundamentals import FundamentalsCache
+from quote_warmer import QuoteWarmer
+from risk import RiskEngine
+from orders import OrderEngine
+from ledger import Ledger
 import utils
 import analytics
 import insights
+import backtest
+import monte_carlo
+import ledger
+import leaderboard
+import metrics
+import price_fetcher
+import ui
+from ui import pause
 
 console = Console()
-f = Figlet(font='standard')
 
 PORTFOLIO_PATH = 'data/portfolio.json'
 LAST_USER_PATH = 'data/last_user.json'
 FIRST_RUN_PATH = 'data/first_run.json'
 
+# quote cache tuning; the background warmer is off unless TRADELAB_WARMER is "user" or "all"
+QUOTE_TTL = int(environ.get("TRADELAB_QUOTE_TTL", 60))
+QUOTE_SWR = int(environ.get("TRADELAB_QUOTE_SWR", 0))
+QUOTE_NEGATIVE_TTL = int(environ.get("TRADELAB_QUOTE_NEGATIVE_TTL", 300))
+QUOTE_CACHE_SIZE = int(environ.get("TRADELAB_QUOTE_CACHE_SIZE", 2048))
+WARMER_MODE = environ.get("TRADELAB_WARMER", "off")
+WARMER_INTERVAL = float(environ.get("TRADELAB_WARMER_INTERVAL", 10))
+WARMER_CONCURRENCY = int(environ.get("TRADELAB_WARMER_CONCURRENCY", 4))
+RISK_BENCHMARK = environ.get("TRADELAB_BENCHMARK", "SPY")
+
 # initialize shared services
-_store = storage.PortfolioStorage()
-_price_fetcher = PriceFetcher(ttl=60)
+_store = storage.open_storage()
+_price_fetcher = PriceFetcher(
+    ttl=QUOTE_TTL,
+    stale_while_revalidate=QUOTE_SWR,
+    negative_ttl=QUOTE_NEGATIVE_TTL,
+    cache_size=QUOTE_CACHE_SIZE,
+)
+_bar_store = BarStore(_price_fetcher.provider)
+_fundamentals = FundamentalsCache(_price_fetcher.provider)
+_risk = RiskEngine(_bar_store, benchmark=RISK_BENCHMARK)
+_ledger = Ledger()
+_orders = OrderEngine(_store, _price_fetcher, _fundamentals, ledger=_ledger)
 
 # initialize modules to use central storage and price fetcher
-utils.init(_store, _price_fetcher)
-analytics.init(_store, _price_fetcher)
-insights.init(_store, _price_fetcher)
+utils.init(_store, _price_fetcher, fundamentals=_fundamentals, order_engine=_orders)
+analytics.init(_store, _price_fetcher, bar_store=_bar_store, fundamentals=_fundamentals, risk_engine=_risk)
+insights.init(_store, _price_fetcher, fundamentals=_fundamentals)
+backtest.init(_bar_store)
+monte_carlo.init(_store, _price_fetcher, _risk)
+ledger.init(_ledger)
+leaderboard.init(_store, _price_fetcher)
+metrics.register("quote_cache", _price_fetcher.stats)
+
+_warmer = None
+if WARMER_MODE in ("user", "all"):
+    _warmer = QuoteWarmer(
+        _price_fetcher, _store,
+        users=[] if WARMER_MODE == "user" else None,
+        interval=WARMER_INTERVAL,
+        max_concurrency=WARMER_CONCURRENCY,
+    )
 
 
 def new_user():
+    """Prompts for a new (or existing) username; returns it, or None to quit."""
     username = input("Enter a username for your account: ").strip()
     if not username:
         console.print("[red]Username cannot be empty.[/red]")
-        return
-    portfolios = _store.load_portfolios()
-    if username in portfolios:
+        return None
+    if _store.get_user(username) is not None:
         console.print(f"[yellow]User '{username}' already exists. Logging in...[/yellow]")
     else:
         _store.create_user_if_missing(username)
         console.print(f"[green]New user '{username}' created![/green]")
     _store.set_last_user(username)
-    main_screen(username)
+    return username
 
 def login_user():
-    portfolios = _store.load_portfolios()
+    """Prompts for an existing username, falling back to account creation; returns it."""
     username = input("Enter your username: ").strip()
-    if username in portfolios:
+    if _store.get_user(username) is not None:
         _store.set_last_user(username)
-        main_screen(username)
-    else:
-        console.print(f"[red]User '{username}' not found. Please create a new account.[/red]")
-        sleep(2)
-        new_user()
+        return username
+    console.print(f"[red]User '{username}' not found. Please create a new account.[/red]")
+    sleep(2)
+    return new_user()
 
 def reset_portfolio(username):
     _store.reset_user(username)
+    _ledger.reset(username)
     console.print(f"[bold yellow]Portfolio for '{username}' has been reset.[/bold yellow]")
     sleep(2)
-    main_screen(username)
 
-def main_screen(username):
-    system('cls' if os_name == 'nt' else 'clear')
+@lru_cache(maxsize=None)
+def render_banner(text):
+    """Figlet rendering is slow and never changes; pyfiglet is loaded on the first draw."""
+    from pyfiglet import Figlet
+    return Figlet(font='standard').renderText(text)
 
-    portfolios = _store.load_portfolios()
-    portfolio = portfolios.get(username)
-    if not portfolio:
-        console.print(f"[red]Portfolio for user '{username}' not found.[/red]")
-        sleep(2)
-        login_user()
-        return
+def mark_equity(username, snap=None):
+    """
+    Records username's equity (holdings + cash) as today's close so far; the ledger
+    derives daily / MTD / YTD returns from it. Run headless at the close to keep a
+    daily curve for users who don't open the app every day.
+    Nothing is marked unless every held position has a fresh quote: an unpriced
+    or stale position would record a fake move that the ledger's peak and
+    drawdown carry forward for good.
+    """
+    snap = snap or analytics.get_snapshot(username)
+    if not snap.stale and (snap.priced | (snap.qty == 0)).all():
+        _ledger.mark(username, snap.total_value + snap.cash_balance)
+    return _ledger.performance(username)
 
-    user_name = portfolio.get("name")
-    value = portfolio.get("cash_balance")
+# command -> (handler taking the username, help text), in menu order
+COMMANDS = {
+    "portfolio": (utils.portfolio, "View your current holdings"),
+    "buy": (utils.buy, "Buy a stock"),
+    "sell": (utils.sell, "Sell a stock"),
+    "risk": (analytics.portfolio_risk_metrics, "Analyze portfolio risk metrics"),
+    "value": (analytics.portfolio_valuation, "View current portfolio valuation"),
+    "insights": (insights.generate_insights, "Get investment insights"),
+    "backtest": (backtest.backtest, "Replay a strategy over historical prices"),
+    "simulate": (monte_carlo.simulate, "Monte Carlo projection of your portfolio"),
+    "history": (ledger.history, "Realized P/L, returns and drawdown"),
+    "leaderboard": (leaderboard.leaderboard, "Rank every account by return, with sector cohorts"),
+    "stats": (metrics.stats, "Timings, data-source calls and cache hit rates for this session"),
+    "reset": (reset_portfolio, "Reset your portfolio"),
+}
+# handled by the session loop itself
+SESSION_COMMANDS = {
+    "logout": "Log out of your account",
+    "exit": "Close the program",
+    "help": "Show this list",
+}
 
-    banner = f.renderText('TradeLab')
-
-
-    banner = Text(banner, style="cyan")
+def render_header(snap):
+    """
+    Builds the banner, account summary and command bar for a portfolio snapshot.
+    Equity is only marked in the ledger once every quote in it is fresh.
+    """
+    perf = mark_equity(snap.username, snap)
+    banner = Text(render_banner('TradeLab'), style="cyan")
     subtitle = Text("“Your personal investing terminal”", style="cyan", justify="center")
-    welcome = Text(f"Welcome {user_name}", style="bold green", justify="center")
-    console.print(Align(banner, align="center"))
-    console.print(subtitle + "\n" + welcome, justify="center")
+    welcome = Text(f"Welcome {snap.name}", style="bold green", justify="center")
 
     table = Table(show_header=False, box=box.SIMPLE, width=100, padding=(1,1))
     table.add_row(
         Text("User:", style="bold red"),
-        Text(user_name, style="bold cyan"),
+        Text(snap.name, style="bold cyan"),
         Text("Portfolio Value:", style="bold red"),
-        Text(f"${analytics.portfolio_value(username)}", style="bold green"),
+        Text(f"${round(snap.total_value, 2)}*", style="bold yellow") if snap.stale
+        else Text(f"${round(snap.total_value, 2)}", style="bold green"),
     )
 
-    portfolio_pnl = analytics.portfolio_pnl(username)
-    pnl_color = "green" if portfolio_pnl >= 0 else "red"
+    pnl_color = "green" if perf["daily_change"] >= 0 else "red"
 
     table.add_row(
         Text("Cash Balance:", style="bold red"),
-        Text(f"${value:,}", style="bold"),
+        Text(f"${snap.cash_balance:,}", style="bold"),
         Text("Daily P/L:", style="bold red"),
-        Text(f"{portfolio_pnl}%", style=f"bold {pnl_color}"),
+        Text(f"${perf['daily_change']:,.2f} ({perf['daily_return'] * 100:.2f}%)", style=f"bold {pnl_color}"),
     )
-    console.print(table, justify="center")
-    console.rule("[bold blue]Commands[/bold blue]", style="blue",)
-
-    commands_text = Text("[portfolio] [buy] [sell] [risk] [value] [insights] [reset] [logout] [exit] [help]")
-    console.print(commands_text, style="yellow", justify="center", height=5)
-    console.rule(style="grey50")
-
-    commands = {
-        "portfolio": utils.portfolio,
-        "risk": analytics.portfolio_risk_metrics,
-        "value": analytics.portfolio_valuation,
-        "insights": insights.generate_insights,
-        "buy": utils.buy,
-        "sell": utils.sell,
-        "reset": reset_portfolio,
-        "logout": login_user,
-        "help": None,
-    }
-
-    while True:
-        cmd = console.input("[bold cyan]> [/bold cyan]").strip().lower()
-
-        if cmd == "exit":
-            console.print("[bold red]Exiting...[/bold red]")
-            break
+    stale_note = [Text(f"* last known prices; refreshing {len(snap.stale)} quote(s)", style="yellow", justify="center")]
+    commands_text = Text(" ".join(f"[{name}]" for name in [*COMMANDS, *SESSION_COMMANDS]), style="yellow", justify="center")
+    return Group(
+        Align(banner, align="center"),
+        Align(subtitle + "\n" + welcome, align="center"),
+        Align(table, align="center"),
+        *(stale_note if snap.stale else []),
+        Rule("[bold blue]Commands[/bold blue]", style="blue"),
+        commands_text,
+        Text(""),
+        Rule(style="grey50"),
+    )
+
+def print_help():
+    lines = [f"[white]{name.capitalize()}[/white] - {text}"
+             for name, text in [*((n, c[1]) for n, c in COMMANDS.items()), *SESSION_COMMANDS.items()]]
+    console.print("\n[bold cyan]Available Commands:[/bold cyan]\n" + "\n".join(lines) + "\n")
 
-        if not cmd:
+_header = {"key": None, "view": None}
+
+def session_header(username):
+    """
+    The main-screen header priced from last-known quotes, rebuilt only when its
+    inputs changed: the user, their record version, the quotes or the day.
+    """
+    snap = analytics.get_snapshot(username, fetch=False)
+    key = (username, snap.version, snap.epoch, snap.stale, date.today())
+    if key != _header["key"]:
+        _header.update(key=key, view=render_header(snap))
+    return _header["view"]
+
+def run_session(username):
+    """
+    The interactive command loop. Commands are dispatched from COMMANDS and the
+    loop (not recursion) returns to the main screen, so a session of any length
+    runs in constant stack depth.
+    """
+    while username:
+        snap = analytics.get_snapshot(username, fetch=False)
+        if snap is None:
+            console.print(f"[red]Portfolio for user '{username}' not found.[/red]")
+            sleep(2)
+            username = login_user()
             continue
 
+        if _warmer and WARMER_MODE == "user":
+            _warmer.set_users([username])
+
+        ui.clear_screen()
+        # draw at once; expired quotes are refetched in the background and redrawn in place
+        pending = _price_fetcher.refresh_async(snap.stale) if snap.stale else None
+        with metrics.command("main_screen"):
+            ui.show_live(console, lambda: session_header(username), pending, lambda: _price_fetcher.epoch)
+
+        while True:
+            cmd = console.input("[bold cyan]> [/bold cyan]").strip().lower()
+            if cmd:
+                break
         base_cmd = cmd.split()[0]
 
-        if base_cmd in commands:
-            try:
-                if base_cmd == "logout":
-                    commands[base_cmd]()
-                    break
-                elif base_cmd == "reset":
-                    commands[base_cmd](username)
-                    break
-                elif base_cmd == "help":
-                    console.print("""
-[bold cyan]Available Commands:[/bold cyan]
-[white]Portfolio[/white] - View your current holdings
-[white]Buy[/white] - Buy a stock
-[white]Sell[/white] - Sell a stock
-[white]Risk[/white] - Analyze portfolio risk metrics
-[white]Value[/white] - View current portfolio valuation
-[white]Insights[/white] - Get investment insights
-[white]Reset[/white] - Reset your portfolio
-[white]Logout[/white] - Log out of your account
-[white]Exit[/white] - Close the program
-                    """)
-                    input("Press Enter to return to main screen...")
-                    main_screen(username)
-                    return
-                else:
-                    # preserve original behavior: pass username to functions that expect it
-                    commands[base_cmd](username)
-                    main_screen(username)
-                    return
-            except Exception as e:
-                console.print(f"[red]Error:[/red] {e}")
-            sleep(1)
-        else:
+        if base_cmd == "exit":
+            console.print("[bold red]Exiting...[/bold red]")
+            return
+        if base_cmd == "logout":
+            username = login_user()
+            continue
+        if base_cmd == "help":
+            print_help()
+            pause("Press Enter to return to main screen...")
+            continue
+        if base_cmd not in COMMANDS:
             console.print("[yellow]Unknown command. Type 'help' for available options.[/yellow]")
             sleep(1)
-            main_screen(username)
-            return
+            continue
+
+        try:
+            with metrics.command(base_cmd):
+                COMMANDS[base_cmd][0](username)
+        except Exception as e:
+            console.print(f"[red]Error:[/red] {e}")
+            sleep(1)
+
+# read-only reports that need no prompts; each returns a JSON-serializable dict
+HEADLESS_COMMANDS = {
+    "portfolio": utils.portfolio,
+    "risk": analytics.portfolio_risk_metrics,
+    "value": analytics.portfolio_valuation,
+    "insights": insights.generate_insights,
+    "history": ledger.history,
+    "leaderboard": leaderboard.leaderboard,
+    "mark": mark_equity,
+    "stats": metrics.stats,
+}
+
+def _json_default(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+def read_script(path):
+    """Reads '<command> [username]' lines; blank lines and # comments are skipped."""
+    steps = []
+    with open(path, "r") as script:
+        for line in script:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                parts = line.split()
+                steps.append((parts[0].lower(), parts[1] if len(parts) > 1 else None))
+    return steps
+
+def run_headless(steps, default_user=None, as_json=False):
+    """
+    Runs (command, username) steps in this process, so storage, quote and bar
+    caches stay warm from one command to the next. With as_json each step prints
+    one JSON line to stdout and human-readable output goes to stderr.
+    Returns the number of failed steps.
+    """
+    ui.set_headless(True)
+    if as_json:
+        for module in (utils, analytics, insights, backtest, monte_carlo, ledger, leaderboard, metrics, price_fetcher):
+            module.console.file = sys.stderr
+
+    failures = 0
+    for cmd, username in steps:
+        username = username or default_user or _store.get_last_user()
+        record = {"cmd": cmd, "user": username}
+        started = perf_counter()
+        try:
+            if cmd not in HEADLESS_COMMANDS:
+                raise ValueError(f"Unknown command '{cmd}'. Headless commands: {', '.join(HEADLESS_COMMANDS)}")
+            if not username or _store.get_user(username) is None:
+                raise ValueError(f"User '{username}' not found.")
+            with metrics.command(cmd):
+                record["result"] = HEADLESS_COMMANDS[cmd](username)
+            record["ok"] = True
+        except Exception as e:
+            failures += 1
+            record["ok"] = False
+            record["error"] = str(e)
+            if not as_json:
+                console.print(f"[red]Error:[/red] {e}")
+        record["ms"] = round((perf_counter() - started) * 1000, 2)
+        if as_json:
+            print(json.dumps(record, default=_json_default), flush=True)
+    return failures
+
+def profile_imports(limit=20):
+    """
+    Starts TradeLab's module loading in a fresh interpreter under -X importtime and
+    prints the slowest imports made by main.py (cumulative, including whatever
+    they pull in first) and the total startup time, without running any command.
+    """
+    src = str(Path(__file__).resolve().parent)
+    started = perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {src!r}); import main"],
+        capture_output=True, text=True,
+    )
+    elapsed = perf_counter() - started
+
+    imports = []
+    children = []  # depth-1 imports since the last top-level line
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        # each level of nesting indents the name by two more spaces; children are listed before their parent
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            # show what main itself imports rather than main as one line
+            imports.extend(children if name.strip() == "main" else [(int(cumulative), name.strip())])
+            children = []
+    imports.sort(reverse=True)
+
+    table = Table(title="Startup imports", box=None, show_edge=True, header_style="bold white")
+    table.add_column("Module", style="bold cyan", justify="left")
+    table.add_column("Cumulative ms", style="bold magenta", justify="right")
+    for cumulative, name in imports[:limit]:
+        table.add_row(name, f"{cumulative / 1000:.1f}")
+    console.print(table)
+    console.print(f"[bold white]Total import time:[/bold white] [bold green]{sum(c for c, _ in imports) / 1000:.1f} ms[/bold green]")
+    console.print(f"[bold white]Interpreter + startup wall time:[/bold white] [bold green]{elapsed * 1000:.1f} ms[/bold green]")
+    if proc.returncode:
+        console.print(f"[red]Startup failed:[/red] {proc.stderr.strip().splitlines()[-1]}")
+    return proc.returncode
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="TradeLab - your personal investing terminal")
+    parser.add_argument("--user", help="user to run headless commands as (default: last user)")
+    parser.add_argument("--cmd", action="append", default=[],
+                        help=f"run a command without the interactive UI; repeatable ({'|'.join(HEADLESS_COMMANDS)})")
+    parser.add_argument("--script", help="file with one '<command> [username]' per line, run in one process")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per command to stdout")
+    parser.add_argument("--profile-imports", action="store_true", help="report where startup import time goes and exit")
+    parser.add_argument("--metrics-out", help="write counters and latency histograms as JSON to this file on exit")
+    parser.add_argument("--profile", metavar="DIR", help="run each command under cProfile, dumping <DIR>/<n>-<command>.prof")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    system('cls' if os_name == 'nt' else 'clear')
+    args = parse_args()
+    if args.profile_imports:
+        sys.exit(profile_imports())
+    if args.metrics_out:
+        atexit.register(metrics.dump, args.metrics_out)
+    if args.profile:
+        metrics.set_profile_dir(args.profile)
+    if args.cmd or args.script:
+        steps = [(cmd.lower(), None) for cmd in args.cmd]
+        if args.script:
+            steps += read_script(args.script)
+        sys.exit(1 if run_headless(steps, args.user, args.json) else 0)
+
+    if _warmer:
+        _warmer.start()
+    ui.clear_screen()
 
     if _store.is_first_run():
         console.print("[bold blue]Welcome to TradeLab![/bold blue]")
@@ -181,12 +412,12 @@ if __name__ == "__main__":
         console.print("[bold yellow]Please follow the setup instructions to configure your profile.[/bold yellow]")
         _store.set_first_run_false()
         sleep(3)
-        new_user()
+        run_session(new_user())
     else:
         last_user = _store.get_last_user()
-        if last_user and last_user in _store.load_portfolios():
+        if last_user and _store.get_user(last_user) is not None:
             console.print(f"[bold green]Auto-loading last user: {last_user}[/bold green]")
             sleep(1)
-            main_screen(last_user)
+            run_session(last_user)
         else:
-            login_user()
+            run_session(login_user())
@@ -0,0 +1,255 @@
+
+import csv
+import json
+import os
+import time
+import zlib
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+REPLAY_DIR = Path(os.environ.get("TRADELAB_REPLAY_DIR", "data/replay"))
+
+_PERIOD_DAYS = {"d": 1, "wk": 7, "mo": 31, "y": 366}
+
+
+def empty_bars():
+    bars = {"date": np.empty(0, dtype="datetime64[D]")}
+    for field in BAR_FIELDS:
+        bars[field] = np.empty(0, dtype=np.float64)
+    return bars
+
+
+def period_start(period, end=None):
+    """Converts a yfinance style period ('5d', '6mo', '1y', 'max') to a start date."""
+    end = end or date.today()
+    if period == "max":
+        return None
+    for suffix, days in _PERIOD_DAYS.items():
+        if period.endswith(suffix) and period[:-len(suffix)].isdigit():
+            return end - timedelta(days=int(period[:-len(suffix)]) * days)
+    raise ValueError(f"Unsupported period: {period}")
+
+
+class MarketDataProvider:
+    """
+    Interface for quotes, daily history and fundamentals.
+    History is returned as a dict of numpy arrays: 'date' (datetime64[D])
+    plus open/high/low/close/volume, oldest first.
+    supports_batch tells callers whether get_quotes is cheaper for many tickers
+    at once than for one ticker per call.
+    """
+    name = "base"
+    supports_batch = False
+
+    def get_quotes(self, tickers):
+        raise NotImplementedError
+
+    def get_history(self, ticker, start=None, period="1y"):
+        raise NotImplementedError
+
+    def get_info(self, ticker):
+        raise NotImplementedError
+
+
+def _yfinance():
+    # yfinance pulls in pandas (most of TradeLab's import time); load it on first request
+    import yfinance
+    return yfinance
+
+
+class YFinanceProvider(MarketDataProvider):
+    name = "yfinance"
+    supports_batch = True
+
+    def get_quotes(self, tickers):
+        tickers = list(tickers)
+        data = _yfinance().download(tickers, period="5d", progress=False, auto_adjust=True, group_by="column")
+        closes = data["Close"] if not data.empty and "Close" in data else None
+
+        quotes = {}
+        for ticker in tickers:
+            if closes is not None and closes.ndim == 2:
+                column = closes[ticker].dropna() if ticker in closes.columns else None
+            else:
+                column = closes.dropna() if closes is not None else None
+            quotes[ticker] = float(round(column.iloc[-1], 2)) if column is not None and not column.empty else None
+        return quotes
+
+    def get_history(self, ticker, start=None, period="1y"):
+        stock = _yfinance().Ticker(ticker)
+        hist = stock.history(start=start.isoformat()) if start else stock.history(period=period)
+        if hist.empty:
+            return empty_bars()
+        index = hist.index.tz_localize(None) if hist.index.tz is not None else hist.index
+        bars = {"date": index.values.astype("datetime64[D]")}
+        for field in BAR_FIELDS:
+            bars[field] = hist[field.capitalize()].to_numpy(dtype=np.float64)
+        return bars
+
+    def get_info(self, ticker):
+        return _yfinance().Ticker(ticker).info or {}
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serves recorded data from disk, no network needed:
+      <root>/<TICKER>.csv   Date,Open,High,Low,Close,Volume bars
+      <root>/<TICKER>.json  fundamentals (sector, trailingPE, beta, ...)
+    Quotes are the last close on or before as_of (default: latest recorded bar).
+    """
+    name = "replay"
+
+    def __init__(self, root=REPLAY_DIR, as_of=None):
+        self.root = Path(root)
+        self.as_of = np.datetime64(as_of, "D") if as_of else None
+        self._bars = {}
+        self._info = {}
+
+    def _load_bars(self, ticker):
+        if ticker in self._bars:
+            return self._bars[ticker]
+        path = self.root / f"{ticker}.csv"
+        if not path.exists():
+            bars = empty_bars()
+        else:
+            with open(path, newline="") as f:
+                rows = [row for row in csv.DictReader(f) if row.get("Date")]
+            rows.sort(key=lambda row: row["Date"])
+            bars = {"date": np.array([row["Date"][:10] for row in rows], dtype="datetime64[D]")}
+            for field in BAR_FIELDS:
+                bars[field] = np.array([float(row.get(field.capitalize()) or "nan") for row in rows], dtype=np.float64)
+        if self.as_of is not None:
+            keep = bars["date"] <= self.as_of
+            bars = {k: v[keep] for k, v in bars.items()}
+        self._bars[ticker] = bars
+        return bars
+
+    def get_quotes(self, tickers):
+        quotes = {}
+        for ticker in tickers:
+            closes = self._load_bars(ticker)["close"]
+            closes = closes[~np.isnan(closes)]
+            quotes[ticker] = float(round(closes[-1], 2)) if len(closes) else None
+        return quotes
+
+    def get_history(self, ticker, start=None, period="1y"):
+        bars = self._load_bars(ticker)
+        if start is None:
+            end = bars["date"][-1].astype(date) if len(bars["date"]) else None
+            start = period_start(period, end) if end else None
+        if start is None:
+            return dict(bars)
+        keep = bars["date"] >= np.datetime64(start, "D")
+        return {k: v[keep] for k, v in bars.items()}
+
+    def get_info(self, ticker):
+        if ticker not in self._info:
+            path = self.root / f"{ticker}.json"
+            try:
+                with open(path, "r") as f:
+                    self._info[ticker] = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._info[ticker] = {}
+        return self._info[ticker]
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Deterministic generated market data for benchmarks and offline runs, no files
+    or network: each ticker gets a seeded random walk of `days` weekday bars
+    ending today, its quote is the last close and its fundamentals are drawn
+    from the same seed. latency (seconds) is slept per request to mimic a slow
+    data source.
+    """
+    name = "synthetic"
+    supports_batch = True
+    SECTORS = ("Technology", "Healthcare", "Financial Services", "Energy", "Industrials",
+               "Consumer Cyclical", "Consumer Defensive", "Utilities", "Real Estate", "Communication Services")
+
+    def __init__(self, seed=0, days=756, latency=0.0):
+        self.seed = seed
+        self.days = days
+        self.latency = latency
+        self._bars = {}
+
+    def _key(self, ticker):
+        return zlib.crc32(ticker.encode())
+
+    def _load_bars(self, ticker):
+        if ticker in self._bars:
+            return self._bars[ticker]
+        rng = np.random.default_rng([self.seed, self._key(ticker)])
+        end = np.datetime64(date.today(), "D")
+        calendar = np.arange(end - self.days * 7 // 5 - 7, end + 1)
+        dates = calendar[np.is_busday(calendar)][-self.days:]
+        n = len(dates)
+        returns = rng.normal(0.0003, rng.uniform(0.008, 0.03), n)
+        close = np.round(rng.uniform(10, 500) * np.exp(np.cumsum(returns)), 2)
+        spread = np.abs(rng.normal(0, 0.01, n)) * close
+        bars = {
+            "date": dates,
+            "open": np.round(close * (1 + rng.normal(0, 0.005, n)), 2),
+            "high": np.round(close + spread, 2),
+            "low": np.round(close - spread, 2),
+            "close": close,
+            "volume": rng.integers(100_000, 10_000_000, n).astype(np.float64),
+        }
+        self._bars[ticker] = bars
+        return bars
+
+    def get_quotes(self, tickers):
+        if self.latency:
+            time.sleep(self.latency)
+        return {ticker: float(self._load_bars(ticker)["close"][-1]) for ticker in tickers}
+
+    def get_history(self, ticker, start=None, period="1y"):
+        if self.latency:
+            time.sleep(self.latency)
+        bars = self._load_bars(ticker)
+        start = start or period_start(period, bars["date"][-1].astype(date))
+        if start is None:
+            return dict(bars)
+        keep = bars["date"] >= np.datetime64(start, "D")
+        return {k: v[keep] for k, v in bars.items()}
+
+    def get_info(self, ticker):
+        rng = np.random.default_rng([self.seed, self._key(ticker), 1])
+        return {
+            "sector": self.SECTORS[self._key(ticker) % len(self.SECTORS)],
+            "trailingPE": round(float(rng.uniform(5, 60)), 2),
+            "beta": round(float(rng.uniform(0.3, 2.0)), 2),
+            "marketCap": int(rng.uniform(1e9, 2e12)),
+        }
+
+
+def record(tickers, root=REPLAY_DIR, source=None, period="1y"):
+    """Records history and fundamentals from source into replay files under root."""
+    source = source or YFinanceProvider()
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    for ticker in tickers:
+        ticker = ticker.upper()
+        bars = source.get_history(ticker, period=period)
+        with open(root / f"{ticker}.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Date"] + [field.capitalize() for field in BAR_FIELDS])
+            for i, day in enumerate(bars["date"]):
+                writer.writerow([str(day)] + [repr(float(bars[field][i])) for field in BAR_FIELDS])
+        info = source.get_info(ticker)
+        with open(root / f"{ticker}.json", "w") as f:
+            json.dump(info, f, indent=4, default=str)
+
+
+def get_provider(name=None):
+    """Builds the provider selected by name or the TRADELAB_MARKET_DATA env var."""
+    name = name or os.environ.get("TRADELAB_MARKET_DATA", "yfinance")
+    if name == "yfinance":
+        return YFinanceProvider()
+    if name == "replay":
+        return ReplayProvider(as_of=os.environ.get("TRADELAB_REPLAY_AS_OF"))
+    if name == "synthetic":
+        return SyntheticProvider(seed=int(os.environ.get("TRADELAB_SYNTHETIC_SEED", 0)))
+    raise ValueError(f"Unknown market data provider: {name}")
@@ -0,0 +1,289 @@
+
+import cProfile
+import json
+import os
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from pathlib import Path
+from threading import Lock, local
+from time import perf_counter
+
+from rich.console import Console
+from rich.table import Table
+
+import ui
+
+console = Console()
+
+# TRADELAB_METRICS=off turns every hook below into a flag check
+ENABLED = os.environ.get("TRADELAB_METRICS", "on") != "off"
+PROFILE_DIR = None  # set_profile_dir(): each command is run under cProfile and dumped here
+
+RECENT_COMMANDS = 10
+
+# latency bucket upper bounds in milliseconds; one more open-ended bucket follows
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_NULL = nullcontext()
+_thread = local()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; percentiles are bucket upper bounds, capped at the max seen."""
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.min = min(self.min, ms)
+        self.max = max(self.max, ms)
+
+    def percentile(self, q):
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "min_ms": round(self.min, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.5), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class Metrics:
+    """
+    In-process counters and latency histograms, keyed by dotted names
+    ("quotes.fetch", "storage.bytes_written", "command.portfolio"). Sources are
+    callables whose dicts (e.g. the quote cache's own hit / miss counters) are
+    included in every snapshot.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.sources = {}
+        self.recent = deque(maxlen=RECENT_COMMANDS)  # latest commands, newest last
+        self._lock = Lock()
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, ms):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(ms)
+
+    def snapshot(self):
+        with self._lock:
+            result = {
+                "enabled": ENABLED,
+                "counters": dict(sorted(self.counters.items())),
+                "latency": {name: h.summary() for name, h in sorted(self.histograms.items())},
+                "recent_commands": list(self.recent),
+            }
+        for name, source in self.sources.items():
+            result[name] = source()
+        return result
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.recent.clear()
+
+
+_metrics = Metrics()
+
+
+def _idle():
+    return getattr(_thread, "idle", 0.0)
+
+
+class _Timer:
+    """Records the time spent inside the with-block, minus time this thread spent waiting on the user."""
+    __slots__ = ("name", "started", "idle")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.idle = _idle()
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.started - (_idle() - self.idle)
+        _metrics.observe(self.name, elapsed * 1000)
+        return False
+
+
+def set_enabled(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+def set_profile_dir(path):
+    global PROFILE_DIR
+    PROFILE_DIR = Path(path) if path else None
+    if PROFILE_DIR:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def incr(name, n=1):
+    if ENABLED:
+        _metrics.incr(name, n)
+
+
+def observe(name, seconds):
+    if ENABLED:
+        _metrics.observe(name, seconds * 1000)
+
+
+def timer(name):
+    """with metrics.timer("storage.save"): ... records a latency sample when enabled."""
+    return _Timer(name) if ENABLED else _NULL
+
+
+def timed(name=None):
+    """Decorator form of timer(); the name defaults to module.function."""
+    def decorate(fn):
+        label = name or f"{fn.__module__}.{fn.__name__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Timer(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def idle():
+    """Marks time spent waiting for the user (prompts, 'Press Enter'), excluded from timers."""
+    if not ENABLED:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        _thread.idle = _idle() + perf_counter() - started
+
+
+def register(name, source):
+    """Includes source()'s dict under name in every snapshot."""
+    _metrics.sources[name] = source
+
+
+_commands = 0
+
+@contextmanager
+def command(name):
+    """
+    Times one user command as "command.<name>" and keeps its counter deltas
+    (how many provider requests, storage writes, ... it caused) in recent_commands.
+    With a profile directory set, the command also runs under cProfile and its
+    stats are dumped to <dir>/<n>-<name>.prof.
+    """
+    global _commands
+    if not ENABLED and PROFILE_DIR is None:
+        yield
+        return
+    _commands += 1
+    profile_path = PROFILE_DIR / f"{_commands:04d}-{name}.prof" if PROFILE_DIR else None
+    profiler = cProfile.Profile() if profile_path else None
+    before = dict(_metrics.counters)
+    idle_before = _idle()
+    started = perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        if ENABLED:
+            ms = (perf_counter() - started - (_idle() - idle_before)) * 1000
+            _metrics.observe(f"command.{name}", ms)
+            _metrics.recent.append({
+                "name": name,
+                "ms": round(ms, 3),
+                "counters": {k: v - before.get(k, 0) for k, v in list(_metrics.counters.items()) if v != before.get(k, 0)},
+                "profile": str(profile_path) if profile_path else None,
+            })
+
+
+def snapshot():
+    return _metrics.snapshot()
+
+
+def reset():
+    _metrics.reset()
+
+
+def dump(path):
+    """Writes the current snapshot as JSON to path."""
+    tmp = Path(path).with_suffix(Path(path).suffix + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(snapshot(), f, indent=4, default=str)
+    os.replace(tmp, path)
+
+
+def stats(username=None):
+    """The `stats` command: counters, latency histograms and cache sources for this process."""
+    data = snapshot()
+    if not ENABLED:
+        console.print("[bold yellow]Metrics are disabled (TRADELAB_METRICS=off).[/bold yellow]")
+
+    latency = Table(title="Latency", box=None, show_edge=True, header_style="bold white")
+    latency.add_column("Timer", style="bold cyan", justify="left")
+    for column in ("Count", "p50 ms", "p95 ms", "Max ms", "Total ms"):
+        latency.add_column(column, style="bold magenta", justify="right")
+    for name, h in data["latency"].items():
+        latency.add_row(name, str(h["count"]), f"{h['p50_ms']:.2f}", f"{h['p95_ms']:.2f}",
+                        f"{h['max_ms']:.2f}", f"{h['total_ms']:.1f}")
+    console.print(latency)
+
+    counters = Table(title="Counters", box=None, show_edge=True, header_style="bold white")
+    counters.add_column("Counter", style="bold cyan", justify="left")
+    counters.add_column("Value", style="bold green", justify="right")
+    for name, value in data["counters"].items():
+        counters.add_row(name, f"{value:,}")
+    console.print(counters)
+
+    for name in _metrics.sources:
+        values = ", ".join(f"{k}={v}" for k, v in data[name].items())
+        console.print(f"[bold white]{name}:[/bold white] [white]{values}[/white]")
+    if data["recent_commands"]:
+        console.print("\n[bold underline white]Recent Commands:[/bold underline white]")
+    for entry in data["recent_commands"]:
+        caused = ", ".join(f"{k}={v}" for k, v in entry["counters"].items()) or "-"
+        console.print(f"  [bold cyan]{entry['name']}[/bold cyan] {entry['ms']:.1f} ms [white]({caused})[/white]")
+
+    ui.pause()
+    return data
@@ -0,0 +1,167 @@
+
+import os
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+import snapshot
+import ui
+from ui import pause
+
+console = Console()
+
+PERCENTILES = (5, 25, 50, 75, 95)
+CHUNK_PATHS = 10_000
+PARALLEL_PATHS = 200_000
+
+_storage = None
+_price_fetcher = None
+_risk = None
+
+def init(storage, price_fetcher, risk_engine):
+    global _storage, _price_fetcher, _risk
+    _storage = storage
+    _price_fetcher = price_fetcher
+    _risk = risk_engine
+
+
+def _simulate_chunk(args):
+    """
+    Generates one chunk of paths and reduces it to what the report needs, so
+    workers never ship full path matrices back: portfolio value at each
+    checkpoint day (paths x checkpoints) and each path's max drawdown.
+    """
+    method, history, mu, sigma, invested, days, n_paths, seed, checkpoints = args
+    rng = np.random.default_rng(seed)
+    if method == "bootstrap":
+        returns = history[rng.integers(0, len(history), size=(n_paths, days))]
+    else:
+        returns = rng.normal(mu, sigma, size=(n_paths, days))
+    returns *= invested
+
+    growth = np.cumprod(1 + returns, axis=1)
+    peaks = np.maximum(np.maximum.accumulate(growth, axis=1), 1.0)
+    drawdown = (growth / peaks - 1).min(axis=1)
+    return growth[:, checkpoints], drawdown
+
+
+def simulate_paths(history, weights, invested=1.0, days=252, paths=10_000, method="bootstrap",
+                   seed=None, checkpoints=None, workers=None):
+    """
+    Projects a portfolio forward with weights held constant (rebalanced daily).
+    history is a days x tickers matrix of historical daily returns; weights are
+    fractions of the invested part and `invested` the share of value not in cash.
+    bootstrap resamples whole historical days, so cross-ticker correlation is kept;
+    normal draws correlated returns from the historical mean and covariance, which
+    for a fixed weight vector is exactly N(w'mu, w'Cw), so it is sampled directly.
+    Paths are generated in fixed chunks seeded from one SeedSequence, so a seed
+    gives the same result whether chunks run in-process or on a process pool
+    (used from PARALLEL_PATHS paths up).
+    Returns growth multiples at the checkpoint days (paths x checkpoints) and
+    per-path max drawdowns.
+    """
+    history = np.asarray(history, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    portfolio = history @ weights
+    mu = float(portfolio.mean())
+    # std of the weighted history equals sqrt(w'Cw) without forming the covariance
+    sigma = float(portfolio.std(ddof=1)) if len(portfolio) > 1 else 0.0
+    if checkpoints is None:
+        checkpoints = np.unique(np.linspace(0, days - 1, min(days, 12)).round().astype(int))
+
+    sizes = [CHUNK_PATHS] * (paths // CHUNK_PATHS) + ([paths % CHUNK_PATHS] if paths % CHUNK_PATHS else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(method, portfolio, mu, sigma, invested, days, size, s, checkpoints) for size, s in zip(sizes, seeds)]
+
+    if paths >= PARALLEL_PATHS and len(jobs) > 1:
+        # multiprocessing is only imported for runs large enough to use it
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            results = list(pool.map(_simulate_chunk, jobs))
+    else:
+        results = [_simulate_chunk(job) for job in jobs]
+    growth = np.concatenate([r[0] for r in results])
+    drawdown = np.concatenate([r[1] for r in results])
+    return checkpoints, growth, drawdown
+
+
+def project(username, days=252, paths=10_000, method="bootstrap", seed=None):
+    """
+    Monte Carlo projection of a user's current holdings (cash earns nothing).
+    Returns percentile bands of portfolio value at checkpoint days, the
+    probability of ending below today's value and the expected max drawdown,
+    or None when the user or price history is missing.
+    """
+    snap = snapshot.get_snapshot(_storage, _price_fetcher, username)
+    if snap is None:
+        return None
+    model = _risk.model([t for t, p in zip(snap.tickers, snap.priced) if p])
+    if not model["tickers"] or len(model["returns"]) < 2:
+        return None
+
+    value_of = dict(zip(snap.tickers, snap.values))
+    values = np.array([value_of[t] for t in model["tickers"]], dtype=np.float64)
+    start_value = snap.total_value + snap.cash_balance
+    invested = float(values.sum() / start_value) if start_value > 0 else 0.0
+    checkpoints, growth, drawdown = simulate_paths(
+        model["returns"], values / values.sum(), invested, days, paths, method, seed)
+
+    bands = np.percentile(growth, PERCENTILES, axis=0) * start_value
+    final = growth[:, -1] * start_value
+    return {
+        "start_value": round(start_value, 2),
+        "days": days,
+        "paths": paths,
+        "method": method,
+        "seed": seed,
+        "covered": model["tickers"],
+        "checkpoints": [int(day) + 1 for day in checkpoints],
+        "bands": {p: [round(float(v), 2) for v in band] for p, band in zip(PERCENTILES, bands)},
+        "expected_value": round(float(final.mean()), 2),
+        "probability_of_loss": float((final < start_value).mean()),
+        "expected_max_drawdown": float(drawdown.mean()),
+        "worst_max_drawdown": float(drawdown.min()),
+    }
+
+
+def print_projection(result):
+    table = Table(title=f"Monte Carlo ({result['paths']:,} paths, {result['method']})", box=None,
+                  show_edge=True, header_style="bold white")
+    table.add_column("Day", style="bold cyan", justify="right")
+    for p in PERCENTILES:
+        table.add_column(f"P{p}", style="bold green" if p == 50 else "white", justify="right")
+    for i, day in enumerate(result["checkpoints"]):
+        table.add_row(str(day), *[f"${result['bands'][p][i]:,.0f}" for p in PERCENTILES])
+    console.print(table)
+
+    console.print(f"[bold white]Starting Value:[/bold white] [bold green]${result['start_value']:,.2f}[/bold green]")
+    console.print(f"[bold white]Expected Value (day {result['days']}):[/bold white] [bold green]${result['expected_value']:,.2f}[/bold green]")
+    console.print(f"[bold white]Probability of Loss:[/bold white] [bold red]{result['probability_of_loss'] * 100:.2f}%[/bold red]")
+    console.print(f"[bold white]Expected Max Drawdown:[/bold white] [bold red]{result['expected_max_drawdown'] * 100:.2f}%[/bold red] "
+                  f"[white](worst {result['worst_max_drawdown'] * 100:.2f}%)[/white]")
+
+
+def simulate(username):
+    try:
+        days = int(ui.prompt("Days to project (default 252): ").strip() or 252)
+        paths = int(ui.prompt("Number of paths (default 10000): ").strip() or 10_000)
+        if days <= 0 or paths <= 0:
+            raise ValueError
+    except ValueError:
+        console.print("[bold red]Days and paths must be positive integers.[/bold red]")
+        pause()
+        return
+    method = ui.prompt("Method [bootstrap/normal] (default bootstrap): ").strip().lower() or "bootstrap"
+    if method not in ("bootstrap", "normal"):
+        console.print("[bold red]Unknown method.[/bold red]")
+        pause()
+        return
+    seed = ui.prompt("Seed (optional): ").strip()
+
+    result = project(username, days, paths, method, int(seed) if seed.isdigit() else None)
+    if result is None:
+        console.print("[bold yellow]Not enough holdings or price history to simulate.[/bold yellow]")
+    else:
+        print_projection(result)
+    pause()
@@ -0,0 +1,148 @@
+
+import metrics
+from positions import total_qty
+from storage import ConflictError
+
+
+class Order:
+    """
+    A market order for whole shares; side is 'buy' or 'sell'. price is the quote
+    the user was shown and confirmed; the order fills at it instead of being
+    priced again by the engine.
+    """
+    def __init__(self, username, side, ticker, qty, price=None):
+        self.username = username
+        self.side = side
+        self.ticker = ticker.strip().upper()
+        self.qty = qty
+        self.price = price
+
+    def __repr__(self):
+        return f"Order({self.username!r}, {self.side!r}, {self.ticker!r}, {self.qty!r}, {self.price!r})"
+
+
+class OrderEngine:
+    """
+    Executes a batch of orders, possibly for several users, with no prompting:
+    all tickers are priced in one pass (and bought tickers' sectors looked up in
+    bulk), each order is validated against the cash and shares left by the orders
+    before it, and every accepted order is committed in a single storage write.
+    Orders follow the same rules as the interactive buy / sell: whole shares,
+    buys must fit in cash, sells fill at the price rounded to cents and consume
+    the oldest lots first. Fills are appended to the ledger when one is given.
+    """
+    def __init__(self, storage, price_fetcher, fundamentals, ledger=None):
+        self.storage = storage
+        self.price_fetcher = price_fetcher
+        self.fundamentals = fundamentals
+        self.ledger = ledger
+
+    def _report(self, order, status, price=None, reason=None):
+        return {
+            "user": order.username,
+            "side": order.side,
+            "ticker": order.ticker,
+            "qty": order.qty,
+            "price": price,
+            "status": status,
+            "reason": reason,
+        }
+
+    @metrics.timed("orders.execute")
+    def execute(self, orders):
+        """
+        Returns one fill report per order, in order: status 'filled' with the cash
+        balance after the fill (and FIFO lot slices plus realized P/L for sells), or
+        'rejected' with a reason. If another session changed one of the users since
+        it was read, storage refuses the whole batch before writing any of it, and
+        every accepted order is reported rejected with nothing sent to the ledger.
+        """
+        orders = list(orders)
+        unquoted = {order.ticker for order in orders if order.price is None}
+        prices = self.price_fetcher.get_prices(unquoted) if unquoted else {}
+        bought = {order.ticker for order in orders
+                  if order.side == "buy" and (order.price is not None or prices.get(order.ticker) is not None)}
+        sectors = self.fundamentals.get_many(bought, "sector", "Unknown") if bought else {}
+
+        books = {}  # username -> [version, cash, {ticker: shares}]
+        reports = []
+        events = []
+        pending = []  # (report, event index)
+        for order in orders:
+            if order.username not in books:
+                user = self.storage.get_user(order.username)
+                books[order.username] = None if user is None else [
+                    user.get("version", 0),
+                    float(user.get("cash_balance", 0.0)),
+                    {ticker: total_qty(lots) for ticker, lots in user.get("holdings", {}).items()},
+                ]
+            book = books[order.username]
+            price = prices.get(order.ticker) if order.price is None else order.price
+
+            if book is None:
+                reports.append(self._report(order, "rejected", reason=f"User '{order.username}' not found."))
+                continue
+            if order.side not in ("buy", "sell"):
+                reports.append(self._report(order, "rejected", reason=f"Unknown order side '{order.side}'."))
+                continue
+            if not isinstance(order.qty, int) or order.qty <= 0:
+                reports.append(self._report(order, "rejected", reason="Quantity must be a positive whole number."))
+                continue
+            if price is None:
+                reports.append(self._report(order, "rejected", reason="Price unavailable."))
+                continue
+
+            version, cash, shares = book
+            if order.side == "buy":
+                if price * order.qty > cash:
+                    reports.append(self._report(order, "rejected", price, "Insufficient funds to complete purchase."))
+                    continue
+                cash -= price * order.qty
+                shares[order.ticker] = shares.get(order.ticker, 0) + order.qty
+                lot = {"qty": order.qty, "price": float(price), "sector": sectors.get(order.ticker, "Unknown")}
+                event = self.storage.next_event("buy", order.username, version, ticker=order.ticker, lot=lot, cash=cash)
+            else:
+                price = float(round(price, 2))
+                if shares.get(order.ticker, 0) == 0:
+                    reports.append(self._report(order, "rejected", price, "You don't own any of that ticker."))
+                    continue
+                if order.qty > shares[order.ticker]:
+                    reports.append(self._report(order, "rejected", price, "You don't have that many shares to sell."))
+                    continue
+                cash += price * order.qty
+                shares[order.ticker] -= order.qty
+                event = self.storage.next_event("sell", order.username, version, ticker=order.ticker, qty=order.qty, cash=cash)
+
+            book[0], book[1] = event["v"], cash
+            report = self._report(order, "filled", price)
+            report["cash_after"] = cash
+            reports.append(report)
+            pending.append((report, len(events)))
+            events.append(event)
+
+        if not events:
+            metrics.incr("orders.rejected", len(reports))
+            return reports
+        try:
+            results = self.storage.commit(events)
+        except ConflictError as e:
+            metrics.incr("orders.conflicts")
+            metrics.incr("orders.rejected", len(reports))
+            for report, _ in pending:
+                report.update(status="rejected", reason=str(e))
+                report.pop("cash_after", None)
+            return reports
+
+        for report, index in pending:
+            sold_lots = results[index]
+            if sold_lots is not None:
+                report["lots"] = sold_lots
+                report["realized_pnl"] = round(sum((report["price"] - lot["buy_price"]) * lot["qty"] for lot in sold_lots), 2)
+        metrics.incr("orders.filled", len(pending))
+        metrics.incr("orders.rejected", len(reports) - len(pending))
+        if self.ledger is not None:
+            self.ledger.record_fills(report for report, _ in pending)
+        return reports
+
+    def execute_one(self, username, side, ticker, qty, price=None):
+        return self.execute([Order(username, side, ticker, qty, price)])[0]
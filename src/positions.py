@@ -0,0 +1,106 @@
+
+from collections import deque
+
+
+class LotQueue(deque):
+    """
+    FIFO queue of one ticker's lots ({'qty', 'price', ...} dicts, oldest first)
+    that keeps the position's total quantity and cost basis up to date as lots
+    are added and consumed, so neither needs a rescan of the lots. Consuming
+    from the front is O(1) per lot touched. Only append / appendleft / extend /
+    pop / popleft / consume / clear keep the totals; don't edit lots in place.
+    Serializes to JSON as a plain list (json.dump(..., default=list)).
+    """
+    def __init__(self, lots=()):
+        super().__init__()
+        self.qty = 0
+        self.cost = 0.0
+        self.extend(lots)
+
+    def __reduce__(self):
+        # rebuild through __init__ so copies and pickles recompute the totals once
+        return type(self), (list(self),)
+
+    def _add(self, lot, sign):
+        qty = int(lot['qty'])
+        self.qty += sign * qty
+        self.cost += sign * qty * float(lot['price'])
+
+    def append(self, lot):
+        super().append(lot)
+        self._add(lot, 1)
+
+    def appendleft(self, lot):
+        super().appendleft(lot)
+        self._add(lot, 1)
+
+    def extend(self, lots):
+        for lot in lots:
+            self.append(lot)
+
+    def pop(self):
+        lot = super().pop()
+        self._add(lot, -1)
+        return lot
+
+    def popleft(self):
+        lot = super().popleft()
+        self._add(lot, -1)
+        return lot
+
+    def clear(self):
+        super().clear()
+        self.qty = 0
+        self.cost = 0.0
+
+    @property
+    def avg_cost(self):
+        return self.cost / self.qty if self.qty else 0.0
+
+    def consume(self, qty):
+        """
+        Removes qty shares from the front (oldest) lots.
+        Returns the consumed slices as [{'qty': n, 'buy_price': p}, ...].
+        """
+        sold_lots = []
+        while qty > 0 and self:
+            lot = self[0]
+            price = float(lot['price'])
+            sell_qty = min(int(lot['qty']), qty)
+            sold_lots.append({'qty': sell_qty, 'buy_price': price})
+            qty -= sell_qty
+            if sell_qty == int(lot['qty']):
+                self.popleft()
+            else:
+                lot['qty'] = int(lot['qty']) - sell_qty
+                self.qty -= sell_qty
+                self.cost -= sell_qty * price
+        if not self:
+            # drop float drift once the position is closed
+            self.cost = 0.0
+        return sold_lots
+
+
+def lot_queue(lots):
+    """Returns lots as a LotQueue, converting a plain list (e.g. freshly loaded JSON) once."""
+    return lots if isinstance(lots, LotQueue) else LotQueue(lots)
+
+
+def as_lot_queues(holdings):
+    """Converts every ticker's lot list in a holdings dict to a LotQueue, in place."""
+    for ticker, lots in holdings.items():
+        holdings[ticker] = lot_queue(lots)
+    return holdings
+
+
+def total_qty(lots):
+    if isinstance(lots, LotQueue):
+        return lots.qty
+    return sum(int(lot['qty']) for lot in lots)
+
+
+def total_cost(lots):
+    if isinstance(lots, LotQueue):
+        return lots.cost
+    return sum(int(lot['qty']) * float(lot['price']) for lot in lots)
+
@@ -1,52 +1,332 @@
 
 import time
-import yfinance as yf
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 
+from market_data import get_provider
+import metrics
+import ui
+
 console = Console()
 
+MISS, FRESH, STALE, NEGATIVE = "miss", "fresh", "stale", "negative"
+
+class QuoteCache:
+    """
+    Bounded LRU quote cache. Prices live `ttl` seconds, failed lookups (None)
+    live `negative_ttl` seconds so bad symbols are not refetched on every render.
+    The least recently used entry is evicted beyond maxsize.
+    epoch increases whenever a stored quote changes, so derived results can be
+    memoized on it.
+    """
+    def __init__(self, ttl=60, negative_ttl=300, maxsize=2048):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # ticker -> (price or None, timestamp)
+        self._lock = Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.epoch = 0
+
+    def lookup(self, ticker, now=None, grace=0):
+        """
+        Returns (price, state). state is FRESH, STALE (expired less than grace
+        seconds ago), NEGATIVE (recent failed lookup, price None) or MISS.
+        """
+        now = now or time.time()
+        with self._lock:
+            entry = self._entries.get(ticker)
+            if entry is None:
+                self.misses += 1
+                return None, MISS
+            price, stamp = entry
+            age = now - stamp
+            if price is None:
+                if age < self.negative_ttl:
+                    self._entries.move_to_end(ticker)
+                    self.negative_hits += 1
+                    return None, NEGATIVE
+            elif age < self.ttl:
+                self._entries.move_to_end(ticker)
+                self.hits += 1
+                return price, FRESH
+            elif age < self.ttl + grace:
+                self._entries.move_to_end(ticker)
+                self.stale_hits += 1
+                return price, STALE
+            self.misses += 1
+            return None, MISS
+
+    def peek(self, ticker):
+        """Returns (price, timestamp) without touching LRU order or counters."""
+        return self._entries.get(ticker)
+
+    def expires_at(self, ticker):
+        entry = self._entries.get(ticker)
+        if entry is None:
+            return 0
+        price, stamp = entry
+        return stamp + (self.ttl if price is not None else self.negative_ttl)
+
+    def put(self, ticker, price, now=None):
+        with self._lock:
+            previous = self._entries.get(ticker)
+            if previous is None or previous[0] != price:
+                self.epoch += 1
+            self._entries[ticker] = (price, now or time.time())
+            self._entries.move_to_end(ticker)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, ticker):
+        with self._lock:
+            self._entries.pop(ticker, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, ticker):
+        return ticker in self._entries
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.negative_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+        }
+
+
 class PriceFetcher:
     """
-    Shared price fetcher with TTL cache. Use get_price(ticker).
+    Shared price fetcher with TTL cache. Use get_price(ticker), or
+    get_prices(tickers) to resolve several symbols in one batched request.
     TTL default is 60 seconds but can be changed per instance.
+    Quotes come from a MarketDataProvider (yfinance unless configured otherwise).
+    Misses are fetched concurrently (at most max_workers requests at a time, in
+    chunks of batch_size for batching providers) and concurrent callers asking
+    for the same ticker share a single in-flight fetch.
+    With stale_while_revalidate > 0, a quote up to that many seconds past its TTL
+    is still served while a background refresh replaces it.
+    Quotes are held in a bounded QuoteCache (cache_size entries); symbols with no
+    data are remembered for negative_ttl seconds and reported as None.
     """
-    def __init__(self, ttl=60):
-        self.ttl = ttl
-        self._cache = {}  # ticker -> {"price": float, "time": timestamp}
-    
-    def show_loader(self, ticker):
+    def __init__(self, ttl=60, provider=None, max_workers=8, batch_size=50, stale_while_revalidate=0,
+                 negative_ttl=300, cache_size=2048):
+        self.stale_while_revalidate = stale_while_revalidate
+        self.provider = provider or get_provider()
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self._cache = QuoteCache(ttl=ttl, negative_ttl=negative_ttl, maxsize=cache_size)
+        self._inflight = {}  # ticker -> Future shared by concurrent callers
+        self._lock = Lock()
+        self._executor = None
+        self._background = None
+
+    @contextmanager
+    def show_loader(self, label):
+        """Shows a spinner for exactly as long as the fetch inside the with-block runs."""
+        if ui.HEADLESS:
+            yield
+            return
         with Progress(
             SpinnerColumn(),
             TextColumn("[cyan]{task.description}"),
             transient=True,
+            console=console,
         ) as progress:
-            progress.add_task(description=f"Fetching {ticker}", total=None)
-            time.sleep(1.2)
+            progress.add_task(description=f"Fetching {label}", total=None)
+            yield
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="quotes")
+            return self._executor
+
+    @property
+    def ttl(self):
+        return self._cache.ttl
+
+    @ttl.setter
+    def ttl(self, value):
+        self._cache.ttl = value
+
+    def _cached(self, ticker, now):
+        """Returns (price, hit); a hit with price None is a cached failed lookup."""
+        price, state = self._cache.lookup(ticker, now, grace=self.stale_while_revalidate)
+        if state == STALE:
+            self.refresh_async([ticker])
+        return price, state != MISS
+
+    def expiring(self, tickers, within=0):
+        """Returns the tickers that are uncached or expire within the next `within` seconds."""
+        deadline = time.time() + within
+        return [t for t in tickers if self._cache.expires_at(t) <= deadline]
+
+    def last_known(self, tickers):
+        """
+        Returns ({ticker: price or None}, stale) from the cache alone, never
+        fetching: expired quotes come back as their last known price and stale
+        holds the tickers whose quote is expired or was never fetched.
+        """
+        now = time.time()
+        prices = {}
+        stale = set()
+        for ticker in tickers:
+            ticker = ticker.upper()
+            entry = self._cache.peek(ticker)
+            if entry is None:
+                prices[ticker] = None
+                stale.add(ticker)
+                continue
+            prices[ticker] = entry[0]
+            if self._cache.expires_at(ticker) <= now:
+                stale.add(ticker)
+        return prices, stale
+
+    @property
+    def epoch(self):
+        """Changes whenever any cached quote changes."""
+        return self._cache.epoch
+
+    def stats(self):
+        return self._cache.stats()
+
+    def _fetch_group(self, tickers, quiet=False):
+        metrics.incr("provider.quote_requests")
+        metrics.incr("provider.quote_tickers", len(tickers))
+        try:
+            with metrics.timer("quotes.fetch"):
+                return self.provider.get_quotes(tickers)
+        except Exception as e:
+            metrics.incr("quotes.errors")
+            if not quiet:
+                console.print(f"[bold red]Error fetching price for {', '.join(tickers)}: {e}[/bold red]")
+            return {}
+
+    def _groups(self, tickers):
+        if self.provider.supports_batch:
+            return [tickers[i:i + self.batch_size] for i in range(0, len(tickers), self.batch_size)]
+        return [[ticker] for ticker in tickers]
+
+    def _fetch_many(self, tickers, quiet=False, pool=None, on_group=None):
+        """Fetches tickers in provider-sized groups; on_group(quotes) sees each group as it lands."""
+        groups = self._groups(tickers)
+        if len(groups) == 1:
+            results = [self._fetch_group(groups[0], quiet)]
+        else:
+            results = (pool or self._pool()).map(self._fetch_group, groups, [quiet] * len(groups))
+        quotes = {}
+        for result in results:
+            if on_group is not None:
+                on_group(result)
+            quotes.update(result)
+        return quotes
+
+    def _fetch(self, tickers, quiet=False, pool=None):
+        """
+        Fetches tickers from the provider, joining any fetch already in flight
+        for the same ticker instead of issuing a duplicate request.
+        """
+        with self._lock:
+            waiting = {t: self._inflight[t] for t in tickers if t in self._inflight}
+            owned = {t: Future() for t in tickers if t not in waiting}
+            self._inflight.update(owned)
+
+        def store(quotes):
+            # cached group by group, so screens drawn from last-known prices update progressively;
+            # tickers missing from a result errored out, only explicit None is cached
+            now = time.time()
+            with self._lock:
+                for ticker, price in quotes.items():
+                    if ticker in owned:
+                        self._cache.put(ticker, price, now)
+
+        prices = {}
+        try:
+            if owned:
+                if quiet:
+                    prices = self._fetch_many(list(owned), quiet, pool, store)
+                else:
+                    with self.show_loader(", ".join(owned) if len(owned) <= 3 else f"{len(owned)} tickers"):
+                        prices = self._fetch_many(list(owned), quiet, pool, store)
+        finally:
+            with self._lock:
+                for ticker in owned:
+                    self._inflight.pop(ticker, None)
+            for ticker, future in owned.items():
+                future.set_result(prices.get(ticker))
+
+        for ticker in owned:
+            if prices.get(ticker) is None and not quiet:
+                console.print(f"[bold red]Warning: No price data for {ticker} from {self.provider.name}.[/bold red]")
+        for ticker, future in waiting.items():
+            prices[ticker] = future.result()
+        return {ticker: prices.get(ticker) for ticker in tickers}
 
     def get_price(self, ticker):
         ticker = ticker.upper()
+        price, hit = self._cached(ticker, time.time())
+        if hit:
+            return price
+        return self._fetch([ticker])[ticker]
+
+    def get_prices(self, tickers):
+        """
+        Returns {ticker: price or None} for every requested ticker.
+        Cache misses are resolved together: one provider request for batching
+        providers, otherwise a bounded concurrent fan-out.
+        """
+        tickers = list(dict.fromkeys(t.upper() for t in tickers))
         now = time.time()
-        cached = self._cache.get(ticker)
-        if cached and now - cached["time"] < self.ttl:
-            return cached["price"]
+        prices = {}
+        missing = []
+        for ticker in tickers:
+            price, hit = self._cached(ticker, now)
+            if hit:
+                prices[ticker] = price
+            else:
+                missing.append(ticker)
 
-        try:
-            self.show_loader(ticker)
-            stock = yf.Ticker(ticker)
-            hist = stock.history(period="1d")
-            if hist.empty or 'Close' not in hist or hist['Close'].empty:
-                console.print(f"[bold red]Warning: No price data for {ticker} from yfinance.[/bold red]")
+        if missing:
+            prices.update(self._fetch(missing))
+        return prices
+
+    def refresh(self, tickers, pool=None):
+        """Refetches tickers regardless of cache state, without loader or warnings."""
+        return self._fetch(list(dict.fromkeys(t.upper() for t in tickers)), quiet=True, pool=pool)
+
+    def refresh_async(self, tickers):
+        """Schedules a background refresh; tickers already in flight are not refetched."""
+        with self._lock:
+            tickers = [t for t in tickers if t not in self._inflight]
+            if not tickers:
                 return None
-            price = float(round(hist['Close'].iloc[-1], 2))
-            self._cache[ticker] = {"price": price, "time": now}
-            return price
-        except Exception as e:
-            console.print(f"[bold red]Error fetching price for {ticker}: {e}[/bold red]")
-            return None
+            if self._background is None:
+                self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quote-refresh")
+            return self._background.submit(self.refresh, tickers)
 
     def invalidate(self, ticker=None):
         if ticker:
-            self._cache.pop(ticker.upper(), None)
+            self._cache.pop(ticker.upper())
         else:
             self._cache.clear()
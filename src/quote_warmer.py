@@ -0,0 +1,60 @@
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QuoteWarmer:
+    """
+    Refresh-ahead scheduler for held tickers. Every `interval` seconds it refreshes
+    quotes that expire within `lead` seconds, so interactive renders hit a warm
+    PriceFetcher cache. Tracks the given users, or every user in storage when
+    users is None. At most max_concurrency provider requests run at once.
+    """
+    def __init__(self, price_fetcher, storage, users=None, interval=10, lead=None, max_concurrency=4):
+        self.price_fetcher = price_fetcher
+        self.storage = storage
+        self.users = set(users) if users is not None else None
+        self.interval = interval
+        self.lead = lead if lead is not None else interval * 1.5
+        self.max_concurrency = max_concurrency
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    def set_users(self, users):
+        self.users = set(users) if users is not None else None
+
+    def tickers(self):
+        return sorted(self.storage.held_tickers(self.users))
+
+    def run_once(self):
+        """Refreshes the tracked tickers that are due; returns the refreshed symbols."""
+        due = self.price_fetcher.expiring(self.tickers(), within=self.lead)
+        if due:
+            self.price_fetcher.refresh(due, pool=self._pool)
+        return due
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # a failed tick must not kill the warmer; the next tick retries
+                pass
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="quote-warmer")
+        self._thread = threading.Thread(target=self._run, name="quote-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval)
+        if self._pool:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,164 @@
+
+from statistics import NormalDist
+from threading import Lock
+
+import numpy as np
+
+BENCHMARK = "SPY"
+TRADING_DAYS = 252
+MIN_OBSERVATIONS = 20
+
+
+def align_closes(series):
+    """
+    Aligns {ticker: (dates, closes)} on the union of their dates as a days x tickers
+    matrix, forward-filling gaps such as holidays on one exchange.
+    Returns (dates, prices) with NaN before a ticker's first close.
+    """
+    dates = np.unique(np.concatenate([d for d, _ in series.values()])) if series else np.empty(0, "datetime64[D]")
+    prices = np.full((len(dates), len(series)), np.nan)
+    for j, (d, closes) in enumerate(series.values()):
+        prices[np.searchsorted(dates, d), j] = closes
+    # forward fill: carry the index of the last valid row down each column
+    valid = ~np.isnan(prices)
+    last = np.where(valid, np.arange(len(dates))[:, None], 0)
+    np.maximum.accumulate(last, axis=0, out=last)
+    filled = prices[last, np.arange(len(series))]
+    filled[np.cumsum(valid, axis=0) == 0] = np.nan
+    return dates, filled
+
+
+class RiskEngine:
+    """
+    Portfolio risk from a date-aligned daily returns matrix (days x tickers)
+    read from the BarStore: covariance-based volatility, regression beta
+    against a benchmark, and historical / parametric VaR and CVaR.
+    The returns matrix, mean and covariance are cached per ticker set and
+    invalidated when any series gains a new bar; whether one did is checked from
+    the BarStore metadata alone, and only the changed series are read again.
+    """
+    def __init__(self, bar_store, benchmark=BENCHMARK, period="1y", confidence=0.95):
+        self.bar_store = bar_store
+        self.benchmark = benchmark
+        self.period = period
+        self.confidence = confidence
+        self._cache = {}  # tickers tuple -> (fingerprint, model)
+        self._series_cache = {}  # ticker -> (bar store stamp, (dates, closes) or None)
+        self._lock = Lock()
+
+    def _stamps(self, tickers):
+        stamps = {}
+        for ticker in tickers:
+            try:
+                stamps[ticker] = self.bar_store.stamp(ticker, self.period)
+            except Exception:
+                continue
+        return stamps
+
+    def _series(self, stamps):
+        """(dates, closes) per ticker with enough history, reading only series whose stamp changed."""
+        series = {}
+        for ticker, stamp in stamps.items():
+            with self._lock:
+                cached = self._series_cache.get(ticker)
+            if cached and cached[0] == stamp:
+                entry = cached[1]
+            else:
+                try:
+                    dates, closes = self.bar_store.get_closes(ticker, self.period)
+                except Exception:
+                    continue
+                keep = ~np.isnan(closes)
+                entry = (np.asarray(dates[keep]), np.asarray(closes[keep])) if keep.sum() > MIN_OBSERVATIONS else None
+                with self._lock:
+                    self._series_cache[ticker] = (stamp, entry)
+            if entry is not None:
+                series[ticker] = entry
+        return series
+
+    def model(self, tickers):
+        """
+        Returns the cached returns model for tickers + benchmark:
+        {"tickers", "dates", "returns" (days x tickers), "benchmark", "mean", "cov"}.
+        Tickers without enough history are left out.
+        """
+        key = tuple(sorted(set(tickers) | {self.benchmark}))
+        stamps = self._stamps(key)
+        fingerprint = tuple(stamps.items())
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == fingerprint:
+                return cached[1]
+
+        series = self._series(stamps)
+        dates, prices = align_closes(series)
+        returns = prices[1:] / prices[:-1] - 1 if len(dates) > 1 else np.empty((0, len(series)))
+        complete = np.all(np.isfinite(returns), axis=1)
+        returns = returns[complete]
+        names = list(series)
+
+        bench = None
+        if self.benchmark in series:
+            j = names.index(self.benchmark)
+            bench = returns[:, j]
+        held = [i for i, t in enumerate(names) if t in set(tickers)]
+        matrix = returns[:, held]
+        model = {
+            "tickers": [names[i] for i in held],
+            "dates": dates[1:][complete],
+            "returns": matrix,
+            "benchmark": bench,
+            "mean": matrix.mean(axis=0) if len(matrix) else np.zeros(len(held)),
+            "cov": np.cov(matrix, rowvar=False).reshape(len(held), len(held)) if len(matrix) > 1 else
+                   np.zeros((len(held), len(held))),
+        }
+        with self._lock:
+            self._cache[key] = (fingerprint, model)
+        return model
+
+    def metrics(self, weights):
+        """
+        weights: {ticker: market value or weight}. Returns daily volatility,
+        annualized volatility, beta and VaR / CVaR (as positive loss fractions
+        of portfolio value at self.confidence).
+        """
+        weights = {t: w for t, w in weights.items() if w > 0}
+        model = self.model(list(weights))
+        w = np.array([weights[t] for t in model["tickers"]], dtype=np.float64)
+        result = {
+            "covered": model["tickers"],
+            "observations": len(model["returns"]),
+            "volatility": 0.0, "annual_volatility": 0.0, "beta": 1.0,
+            "var_hist": 0.0, "cvar_hist": 0.0, "var_param": 0.0, "cvar_param": 0.0,
+        }
+        if not len(w) or w.sum() <= 0 or len(model["returns"]) < 2:
+            return result
+        w = w / w.sum()
+
+        cov = model["cov"]
+        mu = float(model["mean"] @ w)
+        sigma = float(np.sqrt(max(w @ cov @ w, 0.0)))
+        portfolio = model["returns"] @ w
+
+        alpha = 1 - self.confidence
+        var_hist = -float(np.quantile(portfolio, alpha))
+        tail = portfolio[portfolio <= -var_hist]
+        z = NormalDist().inv_cdf(alpha)
+        result.update(
+            volatility=sigma,
+            annual_volatility=sigma * float(np.sqrt(TRADING_DAYS)),
+            var_hist=var_hist,
+            cvar_hist=-float(tail.mean()) if len(tail) else var_hist,
+            var_param=-(mu + z * sigma),
+            cvar_param=-(mu - sigma * NormalDist().pdf(z) / alpha),
+        )
+
+        bench = model["benchmark"]
+        if bench is not None and np.var(bench) > 0:
+            result["beta"] = float(np.cov(portfolio, bench)[0, 1] / np.var(bench, ddof=1))
+        return result
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+            self._series_cache.clear()
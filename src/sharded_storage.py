@@ -0,0 +1,174 @@
+
+import copy
+import os
+from contextlib import ExitStack, contextmanager
+from urllib.parse import quote, unquote
+
+import metrics
+from positions import as_lot_queues
+from storage import (
+    DATA_DIR, PORTFOLIO_PATH, JOURNAL_PATH, ConflictError, PortfolioStorage,
+    apply_event, check_versions, new_user_record, _lock,
+)
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+USERS_DIR = DATA_DIR / "users"
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive OS-level lock on path, held across processes until the block exits."""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class ShardedPortfolioStorage(PortfolioStorage):
+    """
+    One JSON file per user under data/users/, safe to share between processes.
+    Writes take an OS file lock on that user's shard, re-read it, check the
+    record version the caller based its change on (ConflictError on mismatch),
+    and replace the file atomically. Sessions trading different users never
+    contend. A multi-user commit() checks every user's version before writing
+    any shard, but the shards are then replaced one by one, not atomically together.
+    As with the JSON backend, records returned by reads are the cached ones and
+    must be treated as read-only; commit() copies a record before changing it.
+    """
+    def __init__(self, root=USERS_DIR, fsync=True):
+        super().__init__(fsync=fsync)
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._shards = {}  # username -> ((inode, mtime_ns, size), record)
+        self.migrate_from_json()
+
+    def migrate_from_json(self):
+        """Splits portfolio.json (and its journal) into shards when no shard exists yet."""
+        with _lock:
+            if any(self.root.glob("*.json")):
+                return 0
+            if not PORTFOLIO_PATH.exists() and not JOURNAL_PATH.exists():
+                return 0
+            portfolios = PortfolioStorage().load_portfolios()
+            for username, user in portfolios.items():
+                with file_lock(self._lock_path(username)):
+                    self._write_json_atomic(self._path(username), user)
+            return len(portfolios)
+
+    def _path(self, username):
+        return self.root / f"{quote(username, safe='')}.json"
+
+    def _lock_path(self, username):
+        return self.root / f"{quote(username, safe='')}.lock"
+
+    def _read_shard(self, username):
+        """Reads a user's shard, re-parsing only when the file changed on disk."""
+        path = self._path(username)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._shards.pop(username, None)
+            return None
+        # atomic replace gives the shard a new inode, so this also catches same-size rewrites
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._shards.get(username)
+        if cached and cached[0] == key:
+            return cached[1]
+        record = self._read_json(path, None)
+        if record is not None:
+            as_lot_queues(record.setdefault("holdings", {}))
+        self._shards[username] = (key, record)
+        return record
+
+    def _version(self, username):
+        with _lock:
+            user = self._read_shard(username)
+            return user.get("version", 0) if user else 0
+
+    @metrics.timed("storage.commit")
+    def commit(self, events):
+        """
+        Applies events per user; returns per-event results. Every affected user's
+        file lock is taken and every version checked before any shard is written,
+        so a ConflictError leaves all of them unchanged.
+        """
+        by_user = {}
+        for index, event in enumerate(events):
+            by_user.setdefault(event["user"], []).append((index, event))
+
+        results = [None] * len(events)
+        with _lock, ExitStack() as locks:
+            # fixed lock order so two multi-user batches cannot deadlock
+            records = {}
+            for username in sorted(by_user):
+                locks.enter_context(file_lock(self._lock_path(username)))
+                self._shards.pop(username, None)
+                current = copy.deepcopy(self._read_shard(username))
+                check_versions([event for _, event in by_user[username]],
+                               lambda _: current.get("version", 0) if current else 0)
+                records[username] = current
+
+            for username, current in records.items():
+                metrics.incr("storage.events", len(by_user[username]))
+                portfolios = {username: current} if current else {}
+                for index, event in by_user[username]:
+                    results[index] = apply_event(portfolios, event)
+                self._write_json_atomic(self._path(username), portfolios[username])
+        return results
+
+    # portfolio operations
+    def load_portfolios(self):
+        """Reads every shard; prefer get_user() for a single user."""
+        with _lock:
+            portfolios = {}
+            for path in sorted(self.root.glob("*.json")):
+                username = unquote(path.stem)
+                user = self._read_shard(username)
+                if user is not None:
+                    portfolios[username] = user
+            return portfolios
+
+    def save_portfolios(self):
+        """Each commit already rewrote its shard atomically; nothing is buffered."""
+        return None
+
+    def get_user(self, username):
+        with _lock:
+            return self._read_shard(username)
+
+    def held_tickers(self, usernames=None):
+        with _lock:
+            if usernames is None:
+                usernames = [unquote(path.stem) for path in self.root.glob("*.json")]
+            tickers = set()
+            for username in usernames:
+                user = self._read_shard(username)
+                if user:
+                    tickers.update(ticker for ticker, lots in user.get("holdings", {}).items() if lots)
+            return tickers
+
+    def ensure_user(self, username):
+        with _lock:
+            user = self.get_user(username)
+            if user is None:
+                try:
+                    self.commit([self.next_event("put", username, data=new_user_record(username))])
+                except ConflictError:
+                    # another process created the user first
+                    pass
+                user = self.get_user(username)
+            return user
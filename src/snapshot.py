@@ -0,0 +1,111 @@
+
+from threading import Lock
+
+import numpy as np
+
+import holdings as holdings_engine
+import metrics
+
+_memo = {}  # username -> PortfolioSnapshot
+_memo_lock = Lock()
+
+
+class PortfolioSnapshot:
+    """
+    Everything the portfolio screens derive from one user's holdings and current
+    prices, computed in a single vectorized pass: per-ticker qty / price / value /
+    average cost / P&L, totals, weights, sector weights and top holdings.
+    Unpriced positions (no quote) carry NaN price and zero value. stale holds the
+    tickers priced from an expired (or missing) quote.
+    """
+    def __init__(self, username, user, arrays, prices, epoch, stale=frozenset()):
+        self.username = username
+        self.name = user.get("name", username)
+        self.cash_balance = float(user.get("cash_balance", 0.0))
+        self.holdings = user.get("holdings", {})
+        self.version = user.get("version", 0)
+        self.epoch = epoch
+        self.stale = stale
+
+        self.tickers = arrays.tickers
+        self.sectors = arrays.sectors
+        self.qty = arrays.qty
+        self.avg_cost = arrays.avg_cost
+        self.cost = arrays.cost
+        self.price = arrays.price_vector(prices)
+        self.priced = arrays.priced(self.price)
+        self.values = arrays.market_value(self.price)
+        self.pnl = arrays.unrealized_pnl(self.price)
+
+        self.total_value = float(self.values.sum())
+        self.total_pnl = float(self.pnl.sum())
+        self.weights = self.values / self.total_value if self.total_value > 0 else np.zeros_like(self.values)
+        self.sector_values = {}
+        for i in np.flatnonzero(self.priced):
+            self.sector_values[self.sectors[i]] = self.sector_values.get(self.sectors[i], 0.0) + float(self.values[i])
+        self.sector_weights = ({k: round(v / self.total_value * 100, 2) for k, v in self.sector_values.items()}
+                               if self.total_value > 0 else {})
+        order = np.argsort(-self.values, kind="stable")
+        self.top_holdings = [(self.tickers[i], float(self.values[i])) for i in order if self.priced[i]]
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def row(self, ticker):
+        i = self.tickers.index(ticker)
+        return {
+            "ticker": ticker,
+            "qty": int(self.qty[i]),
+            "price": None if np.isnan(self.price[i]) else float(self.price[i]),
+            "value": float(self.values[i]),
+            "avg_cost": float(self.avg_cost[i]),
+            "pnl": float(self.pnl[i]),
+            "weight": float(self.weights[i]),
+            "sector": self.sectors[i],
+        }
+
+
+def get_snapshot(storage, price_fetcher, username, fetch=True):
+    """
+    Returns the PortfolioSnapshot for username (None if the user does not exist),
+    reusing the previous one while neither the user's record version nor any
+    cached quote has changed. With fetch=False nothing is fetched: the snapshot
+    is priced from last-known quotes and its stale set says which are expired.
+    """
+    user = storage.get_user(username)
+    if user is None:
+        return None
+    arrays = holdings_engine.for_user(user, username)
+    # read before pricing: a refresh landing in between then bumps the epoch past
+    # this snapshot's, so the next call rebuilds instead of serving old prices
+    epoch = price_fetcher.epoch
+    if fetch:
+        prices, stale = price_fetcher.get_prices(arrays.tickers), frozenset()
+    else:
+        prices, stale = price_fetcher.last_known(arrays.tickers)
+        stale = frozenset(stale)
+    # every commit stamps a version, so a record without one is unchanged since load
+    version = user.get("version", 0)
+
+    with _memo_lock:
+        cached = _memo.get(username)
+    if cached is not None and (cached.version, cached.epoch, cached.stale) == (version, epoch, stale):
+        metrics.incr("snapshot.memo_hits")
+        return cached
+
+    metrics.incr("snapshot.builds")
+    with metrics.timer("snapshot.build"):
+        snap = PortfolioSnapshot(username, user, arrays, prices, epoch, stale)
+    with _memo_lock:
+        _memo[username] = snap
+    return snap
+
+
+def invalidate(username=None):
+    """Drops the memoized snapshot and holdings arrays for username (or every user)."""
+    with _memo_lock:
+        if username is None:
+            _memo.clear()
+        else:
+            _memo.pop(username, None)
+    holdings_engine.invalidate(username)
@@ -0,0 +1,199 @@
+
+import sqlite3
+from contextlib import contextmanager
+
+import metrics
+from positions import LotQueue
+from storage import DATA_DIR, PORTFOLIO_PATH, JOURNAL_PATH, PortfolioStorage, check_versions, new_user_record, _lock
+
+DB_PATH = DATA_DIR / "portfolio.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    cash_balance REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS lots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+    ticker TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    price REAL NOT NULL,
+    sector TEXT
+);
+CREATE INDEX IF NOT EXISTS lots_user_ticker ON lots(username, ticker, id);
+CREATE INDEX IF NOT EXISTS lots_ticker ON lots(ticker);
+"""
+
+
+class SQLitePortfolioStorage(PortfolioStorage):
+    """
+    PortfolioStorage backed by SQLite (data/portfolio.db): one row per user and
+    one row per lot, indexed by user and ticker. Reads and trades touch only the
+    affected user's rows, and every commit() runs in a single transaction.
+    last_user / first_run metadata stays in the JSON files.
+    On first use an existing portfolio.json (plus journal) is migrated in.
+    """
+    def __init__(self, path=DB_PATH):
+        super().__init__()
+        self.path = path
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self.migrate_from_json()
+
+    def migrate_from_json(self):
+        """Imports portfolio.json (and its journal) when the database has no users yet."""
+        with _lock:
+            if self._conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                return 0
+            if not PORTFOLIO_PATH.exists() and not JOURNAL_PATH.exists():
+                return 0
+            portfolios = PortfolioStorage().load_portfolios()
+            with self._transaction():
+                for username, user in portfolios.items():
+                    self._put(username, user, user.get("version", 0))
+            return len(portfolios)
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _put(self, username, user, version):
+        self._conn.execute("DELETE FROM lots WHERE username = ?", (username,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO users (username, name, cash_balance, version) VALUES (?, ?, ?, ?)",
+            (username, user.get("name", username), float(user.get("cash_balance", 0.0)), version),
+        )
+        self._conn.executemany(
+            "INSERT INTO lots (username, ticker, qty, price, sector) VALUES (?, ?, ?, ?, ?)",
+            [(username, ticker, int(lot["qty"]), float(lot["price"]), lot.get("sector"))
+             for ticker, lots in user.get("holdings", {}).items() for lot in lots],
+        )
+
+    def _consume(self, username, ticker, qty):
+        """FIFO consumption in SQL; only the rows actually consumed are touched."""
+        sold_lots = []
+        rows = self._conn.execute(
+            "SELECT id, qty, price FROM lots WHERE username = ? AND ticker = ? ORDER BY id",
+            (username, ticker),
+        )
+        consumed = []
+        for row in rows:
+            if qty == 0:
+                break
+            sell_qty = min(row["qty"], qty)
+            sold_lots.append({"qty": sell_qty, "buy_price": row["price"]})
+            consumed.append((row["id"], sell_qty, sell_qty == row["qty"]))
+            qty -= sell_qty
+        # mutate only after the scan: changing rows under a live cursor is undefined in SQLite
+        for lot_id, sell_qty, exhausted in consumed:
+            if exhausted:
+                self._conn.execute("DELETE FROM lots WHERE id = ?", (lot_id,))
+            else:
+                self._conn.execute("UPDATE lots SET qty = qty - ? WHERE id = ?", (sell_qty, lot_id))
+        return sold_lots
+
+    def _apply(self, event):
+        username = event["user"]
+        op = event["op"]
+        sold_lots = None
+        if op == "put":
+            self._put(username, event["data"], event["v"])
+            return None
+        if op == "buy":
+            lot = event["lot"]
+            self._conn.execute(
+                "INSERT INTO lots (username, ticker, qty, price, sector) VALUES (?, ?, ?, ?, ?)",
+                (username, event["ticker"], int(lot["qty"]), float(lot["price"]), lot.get("sector")),
+            )
+        elif op == "sell":
+            sold_lots = self._consume(username, event["ticker"], event["qty"])
+        else:
+            raise ValueError(f"Unknown journal op: {op}")
+        self._conn.execute(
+            "UPDATE users SET cash_balance = ?, version = ? WHERE username = ?",
+            (event["cash"], event["v"], username),
+        )
+        return sold_lots
+
+    @metrics.timed("storage.commit")
+    def commit(self, events):
+        """Applies events in one transaction; returns per-event sold lots (None for non-sells)."""
+        with _lock, self._transaction():
+            # versions are checked inside the write transaction, so other processes cannot interleave
+            check_versions(events, self._version)
+            metrics.incr("storage.events", len(events))
+            return [self._apply(event) for event in events]
+
+    # portfolio operations
+    def _version(self, username):
+        row = self._conn.execute("SELECT version FROM users WHERE username = ?", (username,)).fetchone()
+        return row["version"] if row else 0
+
+    def _lot(self, row):
+        return {"qty": row["qty"], "price": row["price"], "sector": row["sector"] or "Unknown"}
+
+    def load_portfolios(self):
+        """Builds the full {username: record} dict; prefer get_user() for a single user."""
+        with _lock:
+            portfolios = {}
+            for row in self._conn.execute("SELECT username, name, cash_balance, version FROM users"):
+                portfolios[row["username"]] = {
+                    "name": row["name"], "cash_balance": row["cash_balance"],
+                    "holdings": {}, "version": row["version"],
+                }
+            for row in self._conn.execute("SELECT username, ticker, qty, price, sector FROM lots ORDER BY id"):
+                portfolios[row["username"]]["holdings"].setdefault(row["ticker"], LotQueue()).append(self._lot(row))
+            return portfolios
+
+    def save_portfolios(self):
+        """Every commit is already durable; this just checkpoints the WAL."""
+        with _lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def get_user(self, username):
+        with _lock:
+            row = self._conn.execute(
+                "SELECT name, cash_balance, version FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return None
+            holdings = {}
+            for lot in self._conn.execute(
+                    "SELECT ticker, qty, price, sector FROM lots WHERE username = ? ORDER BY id", (username,)):
+                holdings.setdefault(lot["ticker"], LotQueue()).append(self._lot(lot))
+            return {
+                "name": row["name"],
+                "cash_balance": row["cash_balance"],
+                "holdings": holdings,
+                "version": row["version"],
+            }
+
+    def held_tickers(self, usernames=None):
+        with _lock:
+            if usernames is None:
+                rows = self._conn.execute("SELECT DISTINCT ticker FROM lots")
+            else:
+                usernames = list(usernames)
+                marks = ",".join("?" * len(usernames))
+                rows = self._conn.execute(f"SELECT DISTINCT ticker FROM lots WHERE username IN ({marks})", usernames)
+            return {row["ticker"] for row in rows}
+
+    def ensure_user(self, username):
+        with _lock:
+            user = self.get_user(username)
+            if user is None:
+                self.commit([self.next_event("put", username, data=new_user_record(username))])
+                user = self.get_user(username)
+            return user
@@ -1,24 +1,100 @@
 
 from pathlib import Path
 import json
+import os
 import time
 from threading import RLock
 
+import metrics
+from positions import as_lot_queues, lot_queue
+
+STORAGE_BACKEND = os.environ.get("TRADELAB_STORAGE", "json")
+
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 PORTFOLIO_PATH = DATA_DIR / "portfolio.json"
+JOURNAL_PATH = DATA_DIR / "portfolio.journal"
 LAST_USER_PATH = DATA_DIR / "last_user.json"
 FIRST_RUN_PATH = DATA_DIR / "first_run.json"
 
+STARTING_CASH = 10000
+
 _lock = RLock()
 
+
+class ConflictError(Exception):
+    """Raised when a write was based on a user record that has changed since it was read."""
+
+
+def new_user_record(username):
+    return {"name": username, "cash_balance": STARTING_CASH, "holdings": {}}
+
+
+def apply_event(portfolios, event):
+    """
+    Applies one journal event to portfolios in place and returns the sold lot
+    slices for a sell (None otherwise). Every event carries the user's record
+    version after the change, so events already folded into a snapshot are
+    skipped and replay is idempotent.
+    """
+    username = event["user"]
+    user = portfolios.get(username)
+    if user is not None and event["v"] <= user.get("version", 0):
+        return None
+    sold_lots = None
+
+    op = event["op"]
+    if op == "put":
+        portfolios[username] = user = dict(event["data"])
+        user["holdings"] = as_lot_queues(dict(user.get("holdings", {})))
+    elif op == "buy":
+        holdings = user["holdings"]
+        holdings[event["ticker"]] = lots = lot_queue(holdings.get(event["ticker"], ()))
+        lots.append(dict(event["lot"]))
+    elif op == "sell":
+        lots = lot_queue(user["holdings"].get(event["ticker"], ()))
+        sold_lots = lots.consume(event["qty"])
+        if lots:
+            user["holdings"][event["ticker"]] = lots
+        else:
+            user["holdings"].pop(event["ticker"], None)
+    else:
+        raise ValueError(f"Unknown journal op: {op}")
+    if "cash" in event:
+        user["cash_balance"] = event["cash"]
+    user["version"] = event["v"]
+    return sold_lots
+
+
+def check_versions(events, version_of):
+    """
+    Optimistic concurrency check: each event must carry exactly the next version
+    of its user's record (version_of(username) + 1, then +1 per event in the batch).
+    """
+    versions = {}
+    for event in events:
+        username = event["user"]
+        current = versions[username] if username in versions else version_of(username)
+        if event["v"] != current + 1:
+            raise ConflictError(
+                f"Portfolio '{username}' changed since it was read (version {current}, write based on {event['v'] - 1}).")
+        versions[username] = event["v"]
+
+
 class PortfolioStorage:
     """
     Centralized portfolio + metadata storage with in-memory caching.
     Use load()/save() rarely — the cache auto-serves reads.
+    Every change is appended to data/portfolio.journal (one JSON event per line)
+    instead of rewriting portfolio.json; the journal is replayed on load and
+    compacted into a new portfolio.json snapshot every compact_every events.
     """
-    def __init__(self):
+    def __init__(self, compact_every=500, fsync=True):
+        self.compact_every = compact_every
+        self.fsync = fsync
         self._cache = None
+        self._journal = None
+        self._journal_events = 0
         self._last_user_cache = None
         self._first_run_cache = None
 
@@ -33,42 +109,133 @@ class PortfolioStorage:
         with open(path, "w") as f:
             json.dump(data, f, indent=4)
 
+    def _write_json_atomic(self, path, data):
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with metrics.timer("storage.write_json"), open(tmp, "w") as f:
+            # lot queues are written as plain lists
+            json.dump(data, f, indent=4, default=list)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            metrics.incr("storage.bytes_written", f.tell())
+        os.replace(tmp, path)
+
+    # journal operations
+    def _replay_journal(self, portfolios):
+        try:
+            f = open(JOURNAL_PATH, "rb")
+        except FileNotFoundError:
+            return 0
+        count = 0
+        good_end = 0
+        with f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn write from a crash: everything after the last full line is dropped
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                apply_event(portfolios, event)
+                good_end += len(line)
+                count += 1
+        if good_end < JOURNAL_PATH.stat().st_size:
+            os.truncate(JOURNAL_PATH, good_end)
+        return count
+
+    def _append(self, lines, count):
+        if self._journal is None:
+            self._journal = open(JOURNAL_PATH, "a")
+        with metrics.timer("storage.journal_append"):
+            self._journal.write(lines)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+        metrics.incr("storage.journal_bytes", len(lines))
+        self._journal_events += count
+        if self._journal_events >= self.compact_every:
+            self.save_portfolios()
+
+    def _version(self, username):
+        user = self.load_portfolios().get(username)
+        return user.get("version", 0) if user else 0
+
+    def next_event(self, op, username, version=None, **fields):
+        """version is the record version the caller read; defaults to the current one."""
+        base = self._version(username) if version is None else version
+        return dict(op=op, user=username, v=base + 1, **fields)
+
+    @metrics.timed("storage.commit")
+    def commit(self, events):
+        """
+        Applies events to the cache and journals them with a single append.
+        Returns the apply_event result for each event; raises ConflictError
+        (writing nothing) if any event is based on an outdated user record.
+        """
+        with _lock:
+            portfolios = self.load_portfolios()
+            check_versions(events, self._version)
+            metrics.incr("storage.events", len(events))
+            # serialize before applying: applied events share lot dicts with the cache
+            lines = "".join(json.dumps(event, separators=(",", ":"), default=list) + "\n" for event in events)
+            results = [apply_event(portfolios, event) for event in events]
+            self._append(lines, len(events))
+            return results
+
     # portfolio operations
     def load_portfolios(self):
         with _lock:
             if self._cache is None:
-                self._cache = self._read_json(PORTFOLIO_PATH, {})
+                with metrics.timer("storage.load"):
+                    self._cache = self._read_json(PORTFOLIO_PATH, {})
+                    for user in self._cache.values():
+                        as_lot_queues(user.setdefault("holdings", {}))
+                    self._journal_events = self._replay_journal(self._cache)
             return self._cache
 
+    @metrics.timed("storage.save")
     def save_portfolios(self):
+        """Writes a full snapshot to portfolio.json and truncates the journal."""
         with _lock:
             if self._cache is None:
                 self._cache = {}
-            self._write_json(PORTFOLIO_PATH, self._cache)
+            self._write_json_atomic(PORTFOLIO_PATH, self._cache)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            open(JOURNAL_PATH, "w").close()
+            self._journal_events = 0
 
     def get_user(self, username):
         portfolios = self.load_portfolios()
         return portfolios.get(username)
 
+    def held_tickers(self, usernames=None):
+        """Returns the set of tickers held by usernames (or by every user)."""
+        with _lock:
+            portfolios = self.load_portfolios()
+            users = portfolios.values() if usernames is None else filter(None, map(portfolios.get, usernames))
+            return {ticker for user in users for ticker, lots in user.get("holdings", {}).items() if lots}
+
     def ensure_user(self, username):
-        portfolios = self.load_portfolios()
-        if username not in portfolios:
-            portfolios[username] = {"name": username, "cash_balance": 10000, "holdings": {}}
-            self.save_portfolios()
-        return portfolios[username]
+        with _lock:
+            portfolios = self.load_portfolios()
+            if username not in portfolios:
+                self.commit([self.next_event("put", username, data=new_user_record(username))])
+            return portfolios[username]
 
     def create_user_if_missing(self, username):
         return self.ensure_user(username)
 
     def update_user(self, username, user_obj):
-        portfolios = self.load_portfolios()
-        portfolios[username] = user_obj
-        self.save_portfolios()
+        with _lock:
+            data = {k: v for k, v in user_obj.items() if k != "version"}
+            self.commit([self.next_event("put", username, version=user_obj.get("version"), data=data)])
 
     def reset_user(self, username):
-        portfolios = self.load_portfolios()
-        portfolios[username] = {"name": username, "cash_balance": 10000, "holdings": {}}
-        self.save_portfolios()
+        with _lock:
+            self.commit([self.next_event("put", username, data=new_user_record(username))])
 
     # last user operations
     def set_last_user(self, username):
@@ -93,3 +260,17 @@ class PortfolioStorage:
         with _lock:
             self._first_run_cache = {"first_run": False}
             self._write_json(FIRST_RUN_PATH, self._first_run_cache)
+
+
+def open_storage(backend=None):
+    """Builds the storage backend selected by name or the TRADELAB_STORAGE env var."""
+    backend = backend or STORAGE_BACKEND
+    if backend == "json":
+        return PortfolioStorage()
+    if backend == "sqlite":
+        from sqlite_storage import SQLitePortfolioStorage
+        return SQLitePortfolioStorage()
+    if backend == "sharded":
+        from sharded_storage import ShardedPortfolioStorage
+        return ShardedPortfolioStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,65 @@
+
+from concurrent.futures import wait
+from os import environ, name as os_name, system
+from time import monotonic
+
+from rich.live import Live
+
+import metrics
+
+HEADLESS = False
+
+# how long a live view keeps redrawing while quotes arrive before handing back the prompt
+LIVE_TIMEOUT = float(environ.get("TRADELAB_LIVE_TIMEOUT", 10))
+
+
+def set_headless(enabled=True):
+    """Headless runs (--cmd / --script) never wait for Enter or clear the terminal."""
+    global HEADLESS
+    HEADLESS = enabled
+
+
+def pause(message="Press Enter to return to main menu..."):
+    if not HEADLESS:
+        with metrics.idle():
+            input(message)
+
+
+def prompt(message):
+    """input() for command prompts; the wait is kept out of command timings."""
+    with metrics.idle():
+        return input(message)
+
+
+def clear_screen():
+    if not HEADLESS:
+        system('cls' if os_name == 'nt' else 'clear')
+
+
+def show_live(console, render, pending=None, changed=None, timeout=None):
+    """
+    Prints render() at once and, while the pending future (e.g. a background
+    quote refresh) runs, redraws it in place each time changed() returns a new
+    value. Gives up waiting after timeout seconds (LIVE_TIMEOUT) or on Ctrl+C;
+    whatever is still missing then shows up on the next draw.
+    Returns the last renderable drawn.
+    """
+    if pending is None or pending.done() or HEADLESS:
+        view = render()
+        console.print(view)
+        return view
+    view = render()
+    deadline = monotonic() + (LIVE_TIMEOUT if timeout is None else timeout)
+    last = changed() if changed else None
+    with Live(view, console=console, auto_refresh=False) as live:
+        try:
+            while not pending.done() and monotonic() < deadline:
+                wait([pending], timeout=min(0.1, max(deadline - monotonic(), 0)))
+                token = changed() if changed else None
+                if token != last or pending.done():
+                    last = token
+                    view = render()
+                    live.update(view, refresh=True)
+        except KeyboardInterrupt:
+            pass
+    return view
@@ -1,20 +1,33 @@
 
 import json
 import time
-from rich.console import Console
+import numpy as np
+from rich.console import Console, Group
 from rich.table import Table
 from rich.text import Text
 
+from fundamentals import FundamentalsCache
+import holdings as holdings_engine
+import metrics
+import snapshot
+from orders import OrderEngine
+import ui
+from ui import pause
+
 console = Console()
 
 # These will be injected/constructed by main.py and imported modules
 _storage = None     # instance of PortfolioStorage
 _price_fetcher = None  # instance of PriceFetcher
+_fundamentals = None  # instance of FundamentalsCache
+_orders = None  # instance of OrderEngine
 
-def init(storage, price_fetcher):
-    global _storage, _price_fetcher
+def init(storage, price_fetcher, fundamentals=None, order_engine=None):
+    global _storage, _price_fetcher, _fundamentals, _orders
     _storage = storage
     _price_fetcher = price_fetcher
+    _fundamentals = fundamentals or FundamentalsCache(price_fetcher.provider)
+    _orders = order_engine or OrderEngine(storage, price_fetcher, _fundamentals)
 
 def get_price(ticker):
     if _price_fetcher is None:
@@ -22,192 +35,153 @@ def get_price(ticker):
         return None
     return _price_fetcher.get_price(ticker)
 
+@metrics.timed()
 def buy(username):
-    portfolios = _storage.load_portfolios()
-    if username not in portfolios:
+    user_data = _storage.get_user(username)
+    if user_data is None:
         console.print(f"[bold red]User '{username}' not found. [/bold red]")
         return
 
-    ticker = input("Enter ticker symbol to buy: ").strip().upper()
+    ticker = ui.prompt("Enter ticker symbol to buy: ").strip().upper()
     price = get_price(ticker)
     console.print(f"[bold white]Current Ticker Price:[/bold white] [bold cyan]{price}[/bold cyan]")
     if price is None:
         console.print("[bold red]Purchase aborted due to unavailable price.[/bold red]")
-        input("Press Enter to return to main menu...")
+        pause()
         return
 
     try:
-        qty = int(input("Enter quantity to buy: ").strip())
+        qty = int(ui.prompt("Enter quantity to buy: ").strip())
         if qty <= 0:
             console.print("[bold red]Quantity must be positive.[/bold red]")
-            input("Press Enter to return to main menu...")
+            pause()
             return
     except ValueError:
         console.print("[bold red]Invalid quantity.[/bold red]")
-        input("Press Enter to return to main menu...")
-        return
-
-    try:
-        stock = __import__("yfinance").Ticker(ticker)
-        sector = stock.info.get('sector', 'Unknown')
-    except Exception:
-        sector = 'Unknown'
-
-    user_data = portfolios[username]
-    cash_balance = float(user_data.get("cash_balance", 0.0))
-    holdings = user_data.get("holdings", {})
-
-    total_cost = price * qty
-    if total_cost > cash_balance:
-        console.print("[bold red]Insufficient funds to complete purchase.[/bold red]")
-        input("Press Enter to return to main menu...")
+        pause()
         return
 
-    cash_balance -= total_cost
+    fill = _orders.execute_one(username, "buy", ticker, qty, price=price)
+    if fill["status"] != "filled":
+        console.print(f"[bold red]{fill['reason']}[/bold red]")
+        pause()
+        return fill
 
-    if ticker not in holdings:
-        holdings[ticker] = []
-    holdings[ticker].append({
-        "qty": int(qty),
-        "price": float(price),
-        "sector": sector
-    })
-
-    user_data["cash_balance"] = cash_balance
-    user_data["holdings"] = holdings
-    _storage.update_user(username, user_data)
-
-    console.print(f"[bold green]Successfully purchased {qty} shares of {ticker} at {price:.2f}![/bold green]")
-    input("Press Enter to return to main menu...")
-    return
+    console.print(f"[bold green]Successfully purchased {qty} shares of {ticker} at {fill['price']:.2f}![/bold green]")
+    pause()
+    return fill
 
+@metrics.timed()
 def sell(username):
-    portfolios = _storage.load_portfolios()
-    if username not in portfolios:
+    user_data = _storage.get_user(username)
+    if user_data is None:
         console.print(f"[bold red]User '{username}' not found in portfolio.[/bold red]")
         return
 
-    user_data = portfolios[username]
-    cash_balance = float(user_data.get("cash_balance", 0.0))
     holdings = user_data.get("holdings", {})
 
     if not holdings:
         console.print("[bold yellow]You have no assets to sell.[/bold yellow]")
-        input("Press Enter to return to main menu...")
+        pause()
         return
 
+    arrays = holdings_engine.for_user(user_data, username)
     console.print("[bold white]Your current assets:[/bold white]")
-    for ticker, lots in holdings.items():
-        total_qty = sum(int(lot['qty']) for lot in lots)
-        avg_price = round(
-            sum(int(lot['qty']) * float(lot['price']) for lot in lots) / total_qty, 2
-        ) if total_qty > 0 else 0
-        sector = lots[0].get('sector', 'Unknown') if lots else 'Unknown'
+    for i, ticker in enumerate(arrays.tickers):
+        total_qty = int(arrays.qty[i])
+        avg_price = round(float(arrays.avg_cost[i]), 2)
+        sector = arrays.sectors[i]
         console.print(f"  [bold cyan]{ticker}[/bold cyan]: {total_qty} shares (Avg buy: ${avg_price}, Sector: [bold cyan]{sector}[/bold cyan])")
 
-    ticker = input("Enter ticker symbol to sell: ").strip().upper()
-    if ticker not in holdings or sum(int(lot['qty']) for lot in holdings[ticker]) == 0:
+    ticker = ui.prompt("Enter ticker symbol to sell: ").strip().upper()
+    if ticker not in arrays.index or arrays.qty[arrays.index[ticker]] == 0:
         console.print("[bold red]You don't own any of that ticker.[/bold red]")
-        input("Press Enter to return to main menu...")
+        pause()
         return
 
     price = get_price(ticker)
     if price is None:
         console.print("[bold red]Sale aborted due to unavailable price.[/bold red]")
-        input("Press Enter to return to main menu...")
+        pause()
         return
-    price = float(round(price, 2))
-    console.print(f"[bold white]Current Ticker Price:[/bold white] [bold cyan]{price}[/bold cyan]")
+    console.print(f"[bold white]Current Ticker Price:[/bold white] [bold cyan]{float(round(price, 2))}[/bold cyan]")
 
     try:
-        qty = int(input("Enter quantity to sell: ").strip())
+        qty = int(ui.prompt("Enter quantity to sell: ").strip())
         if qty <= 0:
             raise ValueError
     except ValueError:
         console.print("[bold red]Invalid quantity.[/bold red]")
-        input("Press Enter to return to main menu...")
+        pause()
         return
 
-    total_qty = sum(int(lot['qty']) for lot in holdings[ticker])
-    if qty > total_qty:
-        console.print("[bold red]You don't have that many shares to sell.[/bold red]")
-        input("Press Enter to return to main menu...")
-        return
-
-    qty_to_sell = qty
-    lots = holdings[ticker]
-    sold_lots = []
-
-    while qty_to_sell > 0 and lots:
-        lot = lots[0]
-        sell_qty = min(int(lot['qty']), qty_to_sell)
-        sold_lots.append({'qty': sell_qty, 'buy_price': float(lot['price'])})
-        lot['qty'] -= sell_qty
-        qty_to_sell -= sell_qty
-        if lot['qty'] == 0:
-            lots.pop(0)
-
-    total_revenue = price * qty
-    cash_balance += total_revenue
-
-    if not lots:
-        del holdings[ticker]
-
-    user_data["cash_balance"] = cash_balance
-    user_data["holdings"] = holdings
-    _storage.update_user(username, user_data)
+    fill = _orders.execute_one(username, "sell", ticker, qty, price=price)
+    if fill["status"] != "filled":
+        console.print(f"[bold red]{fill['reason']}[/bold red]")
+        pause()
+        return fill
 
+    price = fill["price"]
     console.print(f"[bold green]Sold {qty} shares of {ticker} at ${price} per share.[/bold green]")
-    for lot in sold_lots:
+    for lot in fill["lots"]:
         diff = round(price - lot['buy_price'], 2)
         color = "green" if diff >= 0 else "red"
         console.print(f"  - {lot['qty']} shares bought at ${lot['buy_price']} | P/L per share: [{color}]${diff}[/{color}]")
 
-    input("Press Enter to return to main menu...")
+    pause()
+    return fill
 
+@metrics.timed()
 def portfolio(username):
-    portfolios = _storage.load_portfolios()
-    if username not in portfolios:
+    user_data = _storage.get_user(username)
+    if user_data is None:
         console.print(f"[bold red]User '{username}' not found in portfolio.[/bold red]")
         return
 
-    user_data = portfolios[username]
     holdings = user_data.get("holdings", {})
 
     if not holdings:
         console.print("[bold yellow]You have no holdings.[/bold yellow]")
-        time.sleep(2)
-        return
+        if not ui.HEADLESS:
+            time.sleep(2)
+        return {"holdings": [], "total_value": 0.0, "cash_balance": float(user_data.get("cash_balance", 0.0))}
+
+    # interactive: draw from last-known quotes at once and fill in fresh ones as they arrive
+    snap = snapshot.get_snapshot(_storage, _price_fetcher, username, fetch=ui.HEADLESS)
+    pending = _price_fetcher.refresh_async(snap.stale) if snap.stale else None
+    drawn = {}
+
+    def render():
+        current = snap if pending is None else snapshot.get_snapshot(_storage, _price_fetcher, username, fetch=False)
+        drawn["report"], view = portfolio_view(current)
+        return view
+
+    ui.show_live(console, render, pending, lambda: _price_fetcher.epoch)
+    pause()
+    return drawn["report"]
+
+def portfolio_view(snap):
+    """Builds the portfolio table and summary for a snapshot; returns (report dict, renderable)."""
+    # the table shows prices rounded to cents, so values and allocation use the same rounding
+    price_vec = np.round(np.nan_to_num(snap.price), 2)
+    values = np.round(price_vec * snap.qty, 2)
+    total_value = float(values.sum())
+    alloc = np.round(values / total_value * 100, 2) if total_value > 0 else np.zeros_like(values)
 
-    total_value = 0.0
-    sector_alloc = {}
     rows = []
-
-    for ticker, lots in holdings.items():
-        total_qty = sum(int(lot['qty']) for lot in lots)
-        avg_price = round(
-            sum(int(lot['qty']) * float(lot['price']) for lot in lots) / total_qty, 2
-        ) if total_qty > 0 else 0
-
-        current_price = get_price(ticker)
-        current_price = float(round(current_price, 2)) if current_price is not None else 0.0
-        value = round(current_price * total_qty, 2)
-        total_value += value
-
-        sector = lots[0].get('sector', 'Unknown') if lots else 'Unknown'
-        sector_alloc[sector] = sector_alloc.get(sector, 0) + value
-
+    sector_alloc = {}
+    for i, ticker in enumerate(snap.tickers):
+        sector_alloc[snap.sectors[i]] = sector_alloc.get(snap.sectors[i], 0) + float(values[i])
         rows.append({
             "ticker": ticker,
-            "price": current_price,
-            "qty": total_qty,
-            "value": value,
-            "sector": sector
+            "price": float(price_vec[i]),
+            "qty": int(snap.qty[i]),
+            "value": float(values[i]),
+            "sector": snap.sectors[i],
+            "alloc": float(alloc[i]),
+            "stale": ticker in snap.stale,
         })
 
-    for row in rows:
-        row["alloc"] = round(row["value"] / total_value * 100, 2) if total_value > 0 else 0
-
     table = Table(title="Portfolio", box=None, show_edge=True, header_style="bold white")
     table.add_column("Ticker", style="bold cyan", justify="left")
     table.add_column("Price", style="bold green", justify="right")
@@ -217,20 +191,29 @@ def portfolio(username):
     for row in rows:
         table.add_row(
             row["ticker"],
-            f"${row['price']}",
+            Text(f"${row['price']}*", style="yellow") if row["stale"] else f"${row['price']}",
             f"{row['alloc']}%",
             f"${row['value']:,}"
         )
 
-    console.print("\n")
-    console.print(table)
-
     top_sector = max(sector_alloc, key=sector_alloc.get) if sector_alloc else "N/A"
     top_sector_pct = round(sector_alloc[top_sector] / total_value * 100, 2) if total_value > 0 and top_sector != "N/A" else 0
 
-    console.print("\n")
-    console.print(f"[bold white]Total Value:[/bold white] [bold green]${total_value:,.2f}[/bold green]")
-    console.print(f"[bold white]Top Sector:[/bold white] [bold cyan]{top_sector}[/bold cyan] [white]({top_sector_pct}%)[/white]")
-
-    input("Press Enter to return to main menu...")
-    return
\ No newline at end of file
+    lines = [
+        Text(""),
+        table,
+        Text(""),
+        Text.from_markup(f"[bold white]Total Value:[/bold white] [bold green]${total_value:,.2f}[/bold green]"),
+        Text.from_markup(f"[bold white]Top Sector:[/bold white] [bold cyan]{top_sector}[/bold cyan] [white]({top_sector_pct}%)[/white]"),
+    ]
+    if snap.stale:
+        lines.append(Text(f"* last known price; refreshing {len(snap.stale)} quote(s)", style="yellow"))
+
+    report = {
+        "holdings": rows,
+        "total_value": round(total_value, 2),
+        "cash_balance": snap.cash_balance,
+        "top_sector": top_sector,
+        "top_sector_pct": top_sector_pct,
+    }
+    return report, Group(*lines)